@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+# py files
+from bench import stand_ins # offline firestore and discord stand-ins
+from bench import report # percentiles and result files
+
+'''
+Measures how many reaction events OnReactionEvents sustains, end to end through firestore.py, role_queue and rest_scheduler.
+Firestore and discord are replaced with local stand-ins, so no network or credentials are needed.
+Run from the app directory:
+    python -m bench.reactions --events 20000 --guilds 10 --firestore-latency 0.02 --output results.json
+    python -m bench.reactions --compare results.json
+Listener latency is measured from when an event is due to when its listener returns.
+Completion is the time until every queued role change has been sent to the discord stand-in.
+'''
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline reaction throughput benchmark')
+    parser.add_argument('--events', type=int, default=10000, help='reaction events to send')
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--members', type=int, default=2000, help='members per guild')
+    parser.add_argument('--emotes', type=int, default=10, help='emote/role pairs per role message')
+    parser.add_argument('--add-ratio', type=float, default=0.7, help='share of events that are reaction adds')
+    parser.add_argument('--other-message-ratio', type=float, default=0.0, help='share of events on messages that are not role messages')
+    parser.add_argument('--rate', type=float, default=0, help='events per second. 0 sends as fast as the listeners finish')
+    parser.add_argument('--concurrency', type=int, default=100, help='events in flight when --rate is 0')
+    parser.add_argument('--firestore-latency', type=float, default=0.0, help='seconds added to every firestore call')
+    parser.add_argument('--firestore-jitter', type=float, default=0.0, help='up to this many extra seconds per firestore call')
+    parser.add_argument('--rest-latency', type=float, default=0.0, help='seconds added to every discord REST call')
+    parser.add_argument('--member-cache-ratio', type=float, default=1.0, help='share of members in the gateway cache')
+    parser.add_argument('--cold', action='store_true', help='only preload the role message index, guilds load their roles on their first event')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='print the change against an earlier results file')
+    return parser.parse_args(argv)
+
+
+def build_events(args, scenario):
+    chooser = random.Random(args.seed)
+    events = []
+    for _ in range(args.events):
+        guild, messageID, emoteList = chooser.choice(scenario)
+        memberID = chooser.choice(list(guild.members))
+        if chooser.random() < args.other_message_ratio:
+            messageID += 7 # a message that isn't a role message
+        events.append(stand_ins.reaction_payload(guild.id, messageID, memberID, chooser.choice(emoteList), chooser.random() < args.add_ratio))
+    return events
+
+
+async def run(args):
+    store = stand_ins.FirestoreStandIn(args.firestore_latency, args.firestore_jitter, args.seed)
+    stand_ins.install(store)
+    scenario = stand_ins.build_role_guilds(store, args.guilds, args.emotes, args.members, args.rest_latency, args.member_cache_ratio, args.seed)
+    guilds = [guild for guild, messageID, emoteList in scenario]
+
+    # imported after install() so they talk to the stand-ins
+    import firestore
+    import rest_scheduler
+    from cogs.RoleSelection.OnReactionEvents import OnReactionEvents
+
+    cog = OnReactionEvents(stand_ins.FakeBot(guilds))
+    await firestore.preload_guilds()
+    if args.cold:
+        # keep the routing index but drop the cached roles, each guild loads on its first event
+        firestore.roleCache.clear()
+    store.ops.clear()
+
+    events = build_events(args, scenario)
+    latencies = []
+    start = time.perf_counter()
+
+    async def handle(payload, due):
+        if payload.event_type == 'REACTION_ADD':
+            await cog.on_raw_reaction_add(payload)
+        else:
+            await cog.on_raw_reaction_remove(payload)
+        latencies.append(time.perf_counter() - due)
+
+    if args.rate:
+        # open loop, events arrive on schedule whether or not earlier ones finished
+        tasks = []
+        for i, payload in enumerate(events):
+            due = start + i / args.rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(handle(payload, due)))
+        await asyncio.gather(*tasks)
+    else:
+        queue = iter(events)
+
+        async def worker():
+            for payload in queue:
+                await handle(payload, time.perf_counter())
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+
+    listenersDone = time.perf_counter() - start
+    await stand_ins.drain(guilds)
+    completion = time.perf_counter() - start
+
+    restCalls = {}
+    for guild in guilds:
+        for name, count in guild.restCalls.items():
+            restCalls[name] = restCalls.get(name, 0) + count
+    restStats = rest_scheduler.stats()
+    await stand_ins.cancel_background_tasks()
+    return {
+        'benchmark': 'reactions',
+        'params': vars(args),
+        'events': len(events),
+        'duration': listenersDone,
+        'throughput': len(events) / listenersDone if listenersDone else 0.0,
+        'latency': report.latency_summary(latencies),
+        'completion': completion,
+        'firestoreOps': dict(store.ops),
+        'restCalls': restCalls,
+        'restRateLimitWait': restStats['waitTotal']
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = report.save(asyncio.get_event_loop().run_until_complete(run(args)), args.output)
+    latency = results['latency']
+    print(
+        f"{results['events']} events in {results['duration']:.2f}s ({results['throughput']:.1f} events/s)"
+        f"\nlistener latency p50 {latency['p50'] * 1000:.2f}ms | p95 {latency['p95'] * 1000:.2f}ms | p99 {latency['p99'] * 1000:.2f}ms | max {latency['max'] * 1000:.2f}ms"
+        f"\nall role changes sent after {results['completion']:.2f}s | rest calls {results['restCalls']} | firestore ops {results['firestoreOps']}"
+    )
+    if args.compare:
+        report.compare(results, args.compare)
+    if args.output:
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,327 @@
+import argparse
+import asyncio
+import collections
+import inspect
+import json
+import random
+import sys
+import time
+from discord import app_commands
+
+# py files
+from bench import stand_ins # offline firestore and discord stand-ins
+from bench import report # percentiles and result files
+import gateway_recording # recording format
+
+'''
+Replays a gateway recording (see cogs/Diagnostics/GatewayRecorder.py) through the bot's cogs against local stand-ins
+for firestore and discord REST, to reproduce bursts offline.
+Run from the app directory:
+    python -m bench.replay recording.jsonl                 original speed
+    python -m bench.replay recording.jsonl --speed 10      ten times faster
+    python -m bench.replay recording.jsonl --speed 0       as fast as possible
+    python -m bench.replay burst.jsonl --synthesize 20000  write a burst of 20000 members reacting within --burst-seconds, then replay it
+Reports backlog growth (listeners and commands still running, members waiting on role changes, queued REST calls),
+event loop lag and completion time.
+Role messages, emotes, members and channels are taken from the recording. Every recorded emote gets its own role.
+Interactions run for the commands of the cogs loaded here, other commands are counted as skipped.
+'''
+
+replayedCogs = [
+    'cogs.RoleSelection.OnReactionEvents',
+    'cogs.RoleSelection.OnRoleEvents',
+    'cogs.RoleSelection.UpdateRoleMessage',
+    'cogs.RoleSelection.SetRoleMessage'
+]
+adminSecret = 'discord-bot-admin-user-id'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a gateway recording against local stand-ins')
+    parser.add_argument('recording', help='JSONL file written by the gateway recorder')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 replays at the recorded pace, 10 ten times faster, 0 as fast as possible')
+    parser.add_argument('--max-gap', type=float, default=5.0, help='longest pause replayed between two events, in recorded seconds')
+    parser.add_argument('--firestore-latency', type=float, default=0.02)
+    parser.add_argument('--rest-latency', type=float, default=0.1)
+    parser.add_argument('--member-cache-ratio', type=float, default=1.0)
+    parser.add_argument('--admin-id', type=int, help='user allowed to run admin commands. defaults to the most frequent command user')
+    parser.add_argument('--sample-interval', type=float, default=0.1, help='seconds between backlog samples')
+    parser.add_argument('--synthesize', type=int, metavar='MEMBERS', help='write a synthetic burst of MEMBERS reacting to one role message to the recording file first')
+    parser.add_argument('--burst-seconds', type=float, default=60.0)
+    parser.add_argument('--burst-emotes', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='print the change against an earlier results file')
+    return parser.parse_args(argv)
+
+
+def synthesize_burst(path, members, seconds, emoteCount, seed):
+    '''
+    Every member adds one reaction to the same role message at a random time within seconds, a few change their mind
+    '''
+    chooser = random.Random(seed)
+    guildID, channelID, messageID = 200000000000000000, 200000000000000001, 200000000000000002
+    emoteList = stand_ins.emotes(emoteCount)
+    start = time.time()
+    events = []
+    for i in range(members):
+        userID = guildID + 100000 + i
+        emote = chooser.choice(emoteList)
+        at = start + chooser.uniform(0, seconds)
+        events.append((at, 'MESSAGE_REACTION_ADD', userID, emote))
+        if chooser.random() < 0.05:
+            events.append((at + chooser.uniform(0.1, 3), 'MESSAGE_REACTION_REMOVE', userID, emote))
+    with open(path, 'w', encoding='utf-8') as file:
+        for at, eventType, userID, emote in sorted(events):
+            file.write(json.dumps({'ts': round(at, 3), 't': eventType, 'd': {
+                'guild_id': str(guildID),
+                'channel_id': str(channelID),
+                'message_id': str(messageID),
+                'user_id': str(userID),
+                'emoji': {'id': None, 'name': emote, 'animated': False}
+            }}, separators=(',', ':'), ensure_ascii=False) + '\n')
+    return len(events)
+
+
+def load_recording(path, maxGap):
+    '''
+    Return [(offset seconds, event type, data)]. Pauses longer than maxGap, such as between two recording sessions, are shortened
+    '''
+    records = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record['ts'])
+    events = []
+    offset = 0.0
+    previous = records[0]['ts'] if records else 0
+    for record in records:
+        offset += min(record['ts'] - previous, maxGap)
+        previous = record['ts']
+        events.append((offset, record['t'], record['d']))
+    return events
+
+
+def build_scenario(store, events, args):
+    '''
+    Seed the store and build fake guilds matching what the recording touches
+    '''
+    guildMembers = collections.defaultdict(set)
+    guildChannels = collections.defaultdict(set)
+    roleMessages = collections.defaultdict(dict) # format: {guildID: {messageID: (channelID, [emotes])}}
+    commandUsers = collections.Counter()
+    for offset, eventType, data in events:
+        guildID = int(data['guild_id'])
+        guildMembers[guildID].add(int(data['user_id']))
+        guildChannels[guildID].add(int(data['channel_id']))
+        if eventType == 'INTERACTION_CREATE':
+            commandUsers[int(data['user_id'])] += 1
+            continue
+        channelID, emoteList = roleMessages[guildID].setdefault(int(data['message_id']), (int(data['channel_id']), []))
+        emote = gateway_recording.emoji_text(data['emoji'])
+        if emote not in emoteList:
+            emoteList.append(emote)
+
+    guilds = []
+    for guildID, memberIDs in guildMembers.items():
+        roles = []
+        for index, (messageID, (channelID, emoteList)) in enumerate(roleMessages[guildID].items()):
+            # the first message seen is the main role message, the others are additional ones
+            configPath = ('servers', str(guildID), 'features', 'roleSelect')
+            if index:
+                configPath += ('roleMessages', str(messageID))
+            store.seed(configPath, {
+                'enabled': 'true',
+                'messageID': str(messageID),
+                'channelID': str(channelID),
+                'messageTitle': 'Roles',
+                'messageDescription': 'Replayed role message'
+            })
+            for emote in emoteList:
+                role = stand_ins.FakeRole(guildID + 1000 + len(roles), f'role-{len(roles)}')
+                roles.append(role)
+                store.seed(configPath + ('roles', emote), {'roleName': role.name, 'roleEmote': emote, 'roleID': str(role.id)})
+        guilds.append(stand_ins.FakeGuild(guildID, roles, sorted(memberIDs), args.rest_latency, args.member_cache_ratio, args.seed))
+
+    bot = stand_ins.FakeBot(guilds)
+    for guild in guilds:
+        for channelID in guildChannels[guild.id]:
+            bot.add_channel(guild, channelID)
+    adminID = args.admin_id or (commandUsers.most_common(1)[0][0] if commandUsers else 0)
+    return bot, guilds, adminID
+
+
+def command_kwargs(command, options):
+    '''
+    Turn recorded options into callback arguments. Returns None if an option can't be replayed (attachments, channels...)
+    '''
+    parameters = inspect.signature(command.callback).parameters
+    kwargs = {}
+    for option in options:
+        if option['type'] not in (3, 4, 5, 10) or option['name'] not in parameters: # string, integer, boolean, number
+            return None
+        value = option['value']
+        if getattr(parameters[option['name']].annotation, '__origin__', None) is app_commands.Choice:
+            value = app_commands.Choice(name=str(value), value=value)
+        kwargs[option['name']] = value
+    return kwargs
+
+
+class LoopLagMonitor:
+    '''
+    Measures how late the event loop runs a callback that should run every interval seconds
+    '''
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        self.task.cancel()
+
+
+async def run(args):
+    events = load_recording(args.recording, args.max_gap)
+    if not events:
+        raise SystemExit(f'{args.recording} has no events')
+
+    store = stand_ins.FirestoreStandIn(args.firestore_latency, 0.0, args.seed)
+    secrets = {}
+    stand_ins.install(store, secrets)
+    bot, guilds, adminID = build_scenario(store, events, args)
+    secrets[adminSecret] = adminID
+
+    # imported after install() so they talk to the stand-ins
+    import importlib
+    import firestore
+    import role_queue
+    import rest_scheduler
+    commands = {}
+    for name in replayedCogs:
+        module = importlib.import_module(name)
+        cog = getattr(module, name.rsplit('.', 1)[1])(bot)
+        bot.add_cog(cog)
+        for command in cog.walk_app_commands():
+            commands[command.name] = (cog, command)
+    await firestore.preload_guilds()
+    store.ops.clear()
+
+    skipped = collections.Counter()
+    dispatched = collections.Counter()
+    backlog = [] # format: [(seconds since start, listeners and commands running, members with role changes waiting, REST calls queued)]
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+
+    async def sample_backlog():
+        while True:
+            restQueued = sum(rest_scheduler.stats()['queued'].values())
+            backlog.append((round(time.perf_counter() - start, 3), len(bot.tasks), len(role_queue.flushes), restQueued))
+            await asyncio.sleep(args.sample_interval)
+    sampler = asyncio.ensure_future(sample_backlog())
+
+    for i, (offset, eventType, data) in enumerate(events):
+        if args.speed:
+            delay = start + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % 100 == 0:
+            await asyncio.sleep(0) # let listeners run between chunks, like the gateway reader does
+
+        guild = bot.get_guild(int(data['guild_id']))
+        if eventType == 'INTERACTION_CREATE':
+            target = commands.get(data['name'])
+            kwargs = command_kwargs(target[1], data['options']) if target and data['type'] == 2 else None
+            if kwargs is None:
+                skipped[f"/{data['name']}"] += 1
+                continue
+            interaction = stand_ins.FakeInteraction(bot, guild, int(data['user_id']), int(data['channel_id']), int(data['id']))
+            bot.run_task(target[1].callback(target[0], interaction, **kwargs))
+            dispatched[f"/{data['name']}"] += 1
+        else:
+            add = eventType == 'MESSAGE_REACTION_ADD'
+            payload = stand_ins.reaction_payload(guild.id, int(data['message_id']), int(data['user_id']), gateway_recording.emoji_text(data['emoji']), add)
+            payload.channel_id = int(data['channel_id'])
+            bot.dispatch('raw_reaction_add' if add else 'raw_reaction_remove', payload)
+            dispatched[eventType] += 1
+
+    dispatchDone = time.perf_counter() - start
+    while bot.tasks:
+        await asyncio.sleep(0.01)
+    listenersDone = time.perf_counter() - start
+    await stand_ins.drain(guilds)
+    completion = time.perf_counter() - start
+
+    sampler.cancel()
+    monitor.stop()
+    restStats = rest_scheduler.stats()
+    await stand_ins.cancel_background_tasks()
+
+    restCalls = collections.Counter()
+    for guild in guilds:
+        restCalls.update(guild.restCalls)
+    peak = max(backlog, key=lambda sample: sum(sample[1:])) if backlog else (0, 0, 0, 0)
+    # keep about 200 samples in the result file
+    step = max(1, len(backlog) // 200)
+    return {
+        'benchmark': 'replay',
+        'params': vars(args),
+        'events': sum(dispatched.values()),
+        'dispatched': dict(dispatched),
+        'skipped': dict(skipped),
+        'recordedDuration': events[-1][0],
+        'dispatchDuration': dispatchDone,
+        'listenersDone': listenersDone,
+        'completion': completion,
+        'throughput': sum(dispatched.values()) / listenersDone if listenersDone else 0.0,
+        'backlog': {
+            'peak': sum(peak[1:]),
+            'peakAt': peak[0],
+            'peakListeners': peak[1],
+            'peakRoleChanges': peak[2],
+            'peakRestQueued': peak[3],
+            'growthPerSecond': sum(peak[1:]) / peak[0] if peak[0] else 0.0,
+            'samples': backlog[::step]
+        },
+        'loopLag': report.latency_summary(monitor.lags),
+        'firestoreOps': dict(store.ops),
+        'restCalls': dict(restCalls),
+        'restRateLimitWait': restStats['waitTotal']
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.synthesize:
+        count = synthesize_burst(args.recording, args.synthesize, args.burst_seconds, args.burst_emotes, args.seed)
+        print(f'wrote {count} events to {args.recording}')
+    results = report.save(asyncio.get_event_loop().run_until_complete(run(args)), args.output)
+    lag = results['loopLag']
+    backlog = results['backlog']
+    print(
+        f"replayed {results['events']} events recorded over {results['recordedDuration']:.1f}s at speed {args.speed or 'max'}"
+        f"\ndispatched in {results['dispatchDuration']:.2f}s | listeners and commands done after {results['listenersDone']:.2f}s | all role changes sent after {results['completion']:.2f}s"
+        f"\nbacklog peak {backlog['peak']} at {backlog['peakAt']:.1f}s ({backlog['growthPerSecond']:.1f}/s growth): {backlog['peakListeners']} listeners and commands, {backlog['peakRoleChanges']} members waiting on role changes, {backlog['peakRestQueued']} REST calls queued"
+        f"\nevent loop lag p50 {lag['p50'] * 1000:.2f}ms | p99 {lag['p99'] * 1000:.2f}ms | max {lag['max'] * 1000:.2f}ms"
+        f"\nrest calls {results['restCalls']} | firestore ops {results['firestoreOps']}"
+    )
+    if results['skipped']:
+        print(f"skipped {results['skipped']}")
+    if args.compare:
+        report.compare(results, args.compare)
+    if args.output:
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+import json
+import platform
+import subprocess
+import time
+
+'''
+Shared result handling for the benchmarks. Results are JSON so runs from different commits can be compared.
+'''
+
+
+def percentile(sortedValues, fraction):
+    if not sortedValues:
+        return 0.0
+    index = min(len(sortedValues) - 1, int(round(fraction * (len(sortedValues) - 1))))
+    return sortedValues[index]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    return {
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else 0.0,
+        'mean': sum(values) / len(values) if values else 0.0
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def save(results, path):
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'recordedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        **results
+    }
+    if path:
+        with open(path, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    return results
+
+
+def compare(results, baselinePath):
+    '''
+    Print the change in throughput and latency against an earlier result file
+    '''
+    with open(baselinePath) as file:
+        baseline = json.load(file)
+    print(f"compared to {baseline.get('commit')} ({baselinePath}):")
+    old, new = baseline.get('throughput', 0), results.get('throughput', 0)
+    if old:
+        print(f"  throughput {old:.1f} -> {new:.1f} events/s ({(new - old) / old:+.1%})")
+    for key in ('p50', 'p95', 'p99', 'max'):
+        old, new = baseline.get('latency', {}).get(key, 0), results.get('latency', {}).get(key, 0)
+        if old:
+            print(f"  {key} {old * 1000:.2f} -> {new * 1000:.2f} ms ({(new - old) / old:+.1%})")
@@ -0,0 +1,612 @@
+import asyncio
+import collections
+import random
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Local stand-ins for the services the bot talks to, so benchmarks run offline and repeatably.
+FirestoreStandIn is an in-memory copy of the part of the firebase_admin API firestore.py uses, with injectable latency.
+install() puts it (and a no-op cloud logging client) in sys.modules. Call it before importing firestore or logger.
+FakeGuild, FakeMember, FakeRole, FakeChannel, FakeMessage and FakeInteraction stand in for discord objects,
+with injectable REST latency. FakeBot dispatches events to cog listeners as tasks, like discord.py does.
+'''
+
+SERVER_TIMESTAMP = object()
+DELETE_FIELD = object()
+
+
+class FieldPath:
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def to_api_repr(self):
+        return self.parts # update() takes the tuple as a path
+
+
+def merge_into(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_into(target[key], value)
+        else:
+            target[key] = value
+
+
+def resolve(value):
+    if value is SERVER_TIMESTAMP:
+        return time.time()
+    if isinstance(value, dict):
+        return {key: resolve(item) for key, item in value.items()}
+    return value
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class Change:
+    def __init__(self, name, document):
+        self.type = types.SimpleNamespace(name=name)
+        self.document = document
+
+
+class Watch:
+    def __init__(self, store, kind, path, callback):
+        self.store = store
+        self.kind = kind
+        self.path = path
+        self.callback = callback
+
+    def unsubscribe(self):
+        with self.store.lock:
+            if self in self.store.watches:
+                self.store.watches.remove(self)
+
+
+class FirestoreStandIn:
+    '''
+    In-memory firestore. latency (+ up to jitter) seconds are slept before every read, write and batch commit.
+    Snapshot listeners are called on a background thread like the real client.
+    '''
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.docs = {} # format: {path tuple: data}
+        self.lock = threading.Lock()
+        self.watches = []
+        self.ops = collections.Counter()
+        self.notifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix='firestore-watch')
+
+    async def delay(self, operation):
+        self.ops[operation] += 1
+        seconds = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def seed(self, path, data):
+        self.docs[tuple(path)] = resolve(data)
+
+    def children(self, collectionPath):
+        depth = len(collectionPath) + 1
+        return sorted((path, data) for path, data in self.docs.items() if len(path) == depth and path[:-1] == collectionPath)
+
+    def group(self, collectionID):
+        return sorted((path, data) for path, data in self.docs.items() if len(path) % 2 == 0 and path[-2] == collectionID)
+
+    def write(self, path, data):
+        '''
+        data=None deletes. Notifies listeners on the document and its collection.
+        '''
+        with self.lock:
+            before = self.docs.get(path)
+            if data is None:
+                self.docs.pop(path, None)
+            else:
+                self.docs[path] = data
+            watches = [watch for watch in self.watches if watch.path in (path, path[:-1]) or (watch.kind == 'group' and watch.path == path[-2])]
+        for watch in watches:
+            if watch.kind == 'document':
+                self.notify_document(watch)
+            else:
+                name = 'REMOVED' if data is None else ('MODIFIED' if before is not None else 'ADDED')
+                self.notify_collection(watch, [Change(name, DocumentSnapshot(DocumentReference(self, path), data))])
+
+    def notify_document(self, watch):
+        snapshot = DocumentSnapshot(DocumentReference(self, watch.path), self.docs.get(watch.path))
+        self.notifier.submit(watch.callback, [snapshot], [], time.time())
+
+    def notify_collection(self, watch, changes):
+        docs = self.group(watch.path) if watch.kind == 'group' else self.children(watch.path)
+        snapshots = [DocumentSnapshot(DocumentReference(self, path), data) for path, data in docs]
+        self.notifier.submit(watch.callback, snapshots, changes, time.time())
+
+    def watch(self, kind, path, callback):
+        watch = Watch(self, kind, path, callback)
+        with self.lock:
+            self.watches.append(watch)
+        # the first snapshot holds the current state, like the real client
+        if kind == 'document':
+            self.notify_document(watch)
+        else:
+            docs = self.group(path) if kind == 'group' else self.children(path)
+            self.notify_collection(watch, [Change('ADDED', DocumentSnapshot(DocumentReference(self, docPath), data)) for docPath, data in docs])
+        return watch
+
+
+class DocumentReference:
+    def __init__(self, store, path):
+        self.store = store
+        self.path = tuple(path)
+        self.id = self.path[-1]
+
+    @property
+    def parent(self):
+        return CollectionReference(self.store, self.path[:-1])
+
+    def collection(self, collectionID):
+        return CollectionReference(self.store, self.path + (collectionID,))
+
+    async def get(self):
+        await self.store.delay('get')
+        return DocumentSnapshot(self, self.store.docs.get(self.path))
+
+    async def set(self, data, merge=False):
+        await self.store.delay('set')
+        self.apply_set(data, merge)
+
+    def apply_set(self, data, merge=False):
+        data = resolve(data)
+        if merge and self.path in self.store.docs:
+            merged = {key: value for key, value in self.store.docs[self.path].items()}
+            merge_into(merged, data)
+            data = merged
+        self.store.write(self.path, data)
+
+    async def update(self, fields):
+        await self.store.delay('update')
+        data = {key: value for key, value in self.store.docs.get(self.path, {}).items()}
+        for fieldPath, value in fields.items():
+            parts = fieldPath if isinstance(fieldPath, tuple) else tuple(fieldPath.split('.'))
+            target = data
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            if value is DELETE_FIELD:
+                target.pop(parts[-1], None)
+            else:
+                target[parts[-1]] = resolve(value)
+        self.store.write(self.path, data)
+
+    async def delete(self):
+        await self.store.delay('delete')
+        self.store.write(self.path, None)
+
+    def on_snapshot(self, callback):
+        return self.store.watch('document', self.path, callback)
+
+
+class CollectionReference:
+    def __init__(self, store, path):
+        self.store = store
+        self.path = tuple(path)
+        self.id = self.path[-1]
+
+    @property
+    def parent(self):
+        return DocumentReference(self.store, self.path[:-1]) if len(self.path) > 1 else None
+
+    def document(self, documentID):
+        return DocumentReference(self.store, self.path + (documentID,))
+
+    async def stream(self):
+        await self.store.delay('query')
+        for path, data in self.store.children(self.path):
+            yield DocumentSnapshot(DocumentReference(self.store, path), data)
+
+    def on_snapshot(self, callback):
+        return self.store.watch('collection', self.path, callback)
+
+
+class CollectionGroup:
+    def __init__(self, store, collectionID):
+        self.store = store
+        self.collectionID = collectionID
+
+    async def stream(self):
+        await self.store.delay('collection_group')
+        for path, data in self.store.group(self.collectionID):
+            yield DocumentSnapshot(DocumentReference(self.store, path), data)
+
+    def on_snapshot(self, callback):
+        return self.store.watch('group', self.collectionID, callback)
+
+
+class WriteBatch:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+
+    def set(self, reference, data, merge=False):
+        self.writes.append((reference, data, merge))
+
+    def delete(self, reference):
+        self.writes.append((reference, None, False))
+
+    async def commit(self):
+        await self.store.delay('batch')
+        for reference, data, merge in self.writes:
+            if data is None:
+                self.store.write(reference.path, None)
+            else:
+                reference.apply_set(data, merge)
+
+
+class Client:
+    def __init__(self, store):
+        self.store = store
+
+    def collection(self, collectionID):
+        return CollectionReference(self.store, (collectionID,))
+
+    def collection_group(self, collectionID):
+        return CollectionGroup(self.store, collectionID)
+
+    def batch(self):
+        return WriteBatch(self.store)
+
+
+class LoggingClient:
+    '''
+    Cloud logging client that drops everything
+    '''
+    def logger(self, name):
+        return self
+
+    def batch(self):
+        return self
+
+    def log_struct(self, struct, severity=None):
+        pass
+
+    def commit(self):
+        pass
+
+
+def module(name, **attributes):
+    created = types.ModuleType(name)
+    created.__dict__.update(attributes)
+    sys.modules[name] = created
+    return created
+
+
+class SecretManagerClient:
+    '''
+    Secret manager client that serves secrets from a dict
+    '''
+    def __init__(self, secrets):
+        self.secrets = secrets
+
+    def access_secret_version(self, request):
+        secretName = request['name'].split('/')[3] # projects/{project}/secrets/{name}/versions/latest
+        return types.SimpleNamespace(payload=types.SimpleNamespace(data=str(self.secrets[secretName]).encode('UTF-8')))
+
+
+def install(store, secrets=None):
+    '''
+    Route firebase_admin, google cloud logging and secret manager to the stand-ins.
+    Must run before firestore, logger or gcp_secrets is imported.
+    secrets: {secret name: value} served by the secret manager stand-in
+    '''
+    firestoreModule = module('firebase_admin.firestore', client=lambda: Client(store), SERVER_TIMESTAMP=SERVER_TIMESTAMP, DELETE_FIELD=DELETE_FIELD, FieldPath=FieldPath)
+    firestoreAsync = module('firebase_admin.firestore_async', client=lambda: Client(store))
+    credentials = module('firebase_admin.credentials', ApplicationDefault=lambda: None)
+    module('firebase_admin', initialize_app=lambda cred: None, credentials=credentials, firestore=firestoreModule, firestore_async=firestoreAsync)
+
+    google = sys.modules.get('google') or module('google', __path__=[])
+    cloud = sys.modules.get('google.cloud') or module('google.cloud', __path__=[])
+    google.cloud = cloud
+    cloud.logging = module('google.cloud.logging', Client=LoggingClient)
+    secretClient = SecretManagerClient({} if secrets is None else secrets)
+    cloud.secretmanager = module('google.cloud.secretmanager', SecretManagerServiceClient=lambda: secretClient)
+
+
+class FakeRole:
+    def __init__(self, roleID, name, guild=None):
+        self.id = roleID
+        self.name = name
+        self.guild = guild
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMember:
+    def __init__(self, guild, memberID, roles):
+        self.guild = guild
+        self.id = memberID
+        self.roles = roles # roles[0] is @everyone
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def name(self):
+        return f'member-{self.id}'
+
+    async def edit(self, roles=None, reason=None):
+        await self.guild.rest_call('member.edit')
+        self.roles = [self.roles[0]] + list(roles)
+        return self
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.rest_call('member.add_roles')
+            if role not in self.roles:
+                self.roles = self.roles + [role]
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.rest_call('member.remove_roles')
+            self.roles = [held for held in self.roles if held.id != role.id]
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.rest_call('member.send')
+
+
+class FakeGuild:
+    '''
+    memberCacheRatio of the members are in the gateway cache, the rest need a fetch_member REST call.
+    '''
+    def __init__(self, guildID, roles, memberIDs, restLatency=0.0, memberCacheRatio=1.0, seed=None):
+        self.id = guildID
+        self.shard_id = 0
+        self.bot = None # set by FakeBot
+        self.restLatency = restLatency
+        self.restCalls = collections.Counter()
+        self.inflight = 0
+        self.everyone = FakeRole(guildID, '@everyone')
+        self.roles = [self.everyone] + roles
+        for role in self.roles:
+            role.guild = self
+        self.roleMap = {role.id: role for role in self.roles}
+        self.nextRoleID = guildID + 900000
+        self.members = {memberID: FakeMember(self, memberID, [self.everyone]) for memberID in memberIDs}
+        chooser = random.Random(seed)
+        self.cachedMembers = {memberID for memberID in memberIDs if chooser.random() < memberCacheRatio}
+
+    async def rest_call(self, name):
+        self.restCalls[name] += 1
+        self.inflight += 1
+        try:
+            if self.restLatency:
+                await asyncio.sleep(self.restLatency)
+        finally:
+            self.inflight -= 1
+
+    def get_role(self, roleID):
+        return self.roleMap.get(roleID)
+
+    def get_member(self, memberID):
+        return self.members.get(memberID) if memberID in self.cachedMembers else None
+
+    async def fetch_member(self, memberID):
+        await self.rest_call('fetch_member')
+        return self.members[memberID]
+
+    async def create_role(self, name=None, **kwargs):
+        await self.rest_call('create_role')
+        self.nextRoleID += 1
+        role = FakeRole(self.nextRoleID, name, self)
+        self.roles.append(role)
+        self.roleMap[role.id] = role
+        if self.bot:
+            self.bot.dispatch('guild_role_create', role) # discord sends the gateway event for the new role
+        return role
+
+
+class FakeMessage:
+    def __init__(self, channel, messageID):
+        self.channel = channel
+        self.id = messageID
+        self.embeds = []
+        self.reactions = []
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        await self.channel.guild.rest_call('message.edit')
+        if embed is not None:
+            self.embeds = [embed]
+
+    async def add_reaction(self, emoji):
+        await self.channel.guild.rest_call('message.add_reaction')
+        if not any(str(reaction.emoji) == str(emoji) for reaction in self.reactions):
+            self.reactions.append(types.SimpleNamespace(emoji=emoji, me=True, count=1))
+
+    async def clear_reaction(self, emoji):
+        await self.channel.guild.rest_call('message.clear_reaction')
+        self.reactions = [reaction for reaction in self.reactions if str(reaction.emoji) != str(emoji)]
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeChannel:
+    def __init__(self, guild, channelID):
+        self.guild = guild
+        self.id = channelID
+        self.messages = {}
+        self.nextMessageID = channelID + 1000
+
+    def message(self, messageID):
+        if messageID not in self.messages:
+            self.messages[messageID] = FakeMessage(self, messageID)
+        return self.messages[messageID]
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.rest_call('channel.send')
+        self.nextMessageID += 1
+        return self.message(self.nextMessageID)
+
+    async def fetch_message(self, messageID):
+        await self.guild.rest_call('channel.fetch_message')
+        return self.message(messageID) # messages from a recording exist on discord, create them on first fetch
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.message = None
+
+    async def defer(self, ephemeral=False, thinking=False):
+        await self.interaction.guild.rest_call('interaction.defer')
+
+    async def send_message(self, content=None, embed=None, ephemeral=False, **kwargs):
+        await self.interaction.guild.rest_call('interaction.send_message')
+        channel = self.interaction.channel
+        channel.nextMessageID += 1
+        self.message = channel.message(channel.nextMessageID)
+        if embed is not None:
+            self.message.embeds = [embed]
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self.interaction.guild.rest_call('interaction.followup')
+
+
+class FakeInteraction:
+    def __init__(self, bot, guild, userID, channelID, interactionID):
+        self.id = interactionID
+        self.client = bot
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel_id = channelID
+        self.channel = bot.get_channel(channelID)
+        if userID not in guild.members:
+            guild.members[userID] = FakeMember(guild, userID, [guild.everyone])
+            guild.cachedMembers.add(userID)
+        self.user = guild.members[userID]
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def original_response(self):
+        return self.response.message
+
+
+class FakeBot:
+    '''
+    Holds the fake guilds and channels and runs cog listeners for dispatched events
+    '''
+    def __init__(self, guilds):
+        self.guilds = {guild.id: guild for guild in guilds}
+        self.channels = {}
+        self.listeners = collections.defaultdict(list) # format: {event name: [listener]}
+        self.tasks = set() # listener tasks still running
+        for guild in guilds:
+            guild.bot = self
+
+    def get_guild(self, guildID):
+        return self.guilds.get(guildID)
+
+    def add_channel(self, guild, channelID):
+        if channelID not in self.channels:
+            self.channels[channelID] = FakeChannel(guild, channelID)
+        return self.channels[channelID]
+
+    def get_channel(self, channelID):
+        return self.channels.get(channelID)
+
+    def add_cog(self, cog):
+        for name, listener in cog.get_listeners():
+            self.listeners[name].append(listener)
+
+    def run_task(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def dispatch(self, event, *args):
+        for listener in self.listeners.get(f'on_{event}', []):
+            self.run_task(listener(*args))
+
+
+def reaction_payload(guildID, messageID, memberID, emote, add=True, member=None):
+    # the fields of discord.RawReactionActionEvent the listeners read
+    return types.SimpleNamespace(
+        guild_id=guildID,
+        message_id=messageID,
+        channel_id=messageID - 1,
+        user_id=memberID,
+        emoji=emote,
+        member=member,
+        event_type='REACTION_ADD' if add else 'REACTION_REMOVE'
+    )
+
+
+async def drain(guilds):
+    '''
+    Wait until every queued role change has reached the discord stand-in
+    '''
+    import role_queue
+    import rest_scheduler
+    idle = 0
+    while idle < 3:
+        await asyncio.sleep(0.01)
+        busy = role_queue.flushes or sum(rest_scheduler.stats()['queued'].values()) or any(guild.inflight for guild in guilds)
+        idle = 0 if busy else idle + 1
+
+
+async def cancel_background_tasks():
+    # the rest scheduler workers and listener timers run forever, stop them before the loop closes
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def emotes(count):
+    return [chr(0x1F600 + i) for i in range(count)]
+
+
+def build_role_guilds(store, guildCount, emoteCount, memberCount, restLatency=0.0, memberCacheRatio=1.0, seed=None):
+    '''
+    Seed the store with one role message per guild and emoteCount emote/role pairs, and build matching fake guilds.
+    Returns [(guild, messageID, [emotes])]
+    '''
+    scenario = []
+    emoteList = emotes(emoteCount)
+    for g in range(guildCount):
+        guildID = 100000000000000000 + g * 1000000
+        messageID = guildID + 1
+        roles = [FakeRole(guildID + 1000 + i, f'role-{i}') for i in range(emoteCount)]
+        store.seed(('servers', str(guildID), 'features', 'roleSelect'), {
+            'enabled': 'true',
+            'messageID': str(messageID),
+            'channelID': str(messageID - 1),
+            'messageTitle': 'Roles',
+            'messageDescription': 'Pick your roles'
+        })
+        for emote, role in zip(emoteList, roles):
+            store.seed(('servers', str(guildID), 'features', 'roleSelect', 'roles', emote), {
+                'roleName': role.name,
+                'roleEmote': emote,
+                'roleID': str(role.id)
+            })
+        memberIDs = [guildID + 500000 + i for i in range(memberCount)]
+        guild = FakeGuild(guildID, roles, memberIDs, restLatency, memberCacheRatio, seed)
+        scenario.append((guild, messageID, emoteList))
+    return scenario
@@ -0,0 +1,149 @@
+from discord.ext import commands, tasks
+import time
+
+# py files
+import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+import translate_cache # memoized translation results
+import language_id # offline language detection
+import sharding # shard assignment and per-shard stats
+import metrics # command latencies
+import gcp_secrets # function to retrieve discord private key from gcp secret manager
+
+
+class Diagnostics(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.sample_shards.change_interval(seconds=sharding.sampleInterval)
+
+    async def cog_load(self):
+        self.sample_shards.start()
+
+    async def cog_unload(self):
+        self.sample_shards.cancel()
+
+    @tasks.loop(seconds=10)
+    async def sample_shards(self):
+        sharding.sample(self.bot)
+
+    @commands.Cog.listener()
+    async def on_shard_connect(self, shard_id):
+        sharding.connects[shard_id] += 1
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id):
+        sharding.disconnects[shard_id] += 1
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id):
+        sharding.resumes[shard_id] += 1
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction, command):
+        metrics.command_completed(f'/{command.qualified_name}', interaction.extras.get('started'))
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        ctx.started = time.perf_counter()
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        metrics.command_completed(f'!{ctx.command.qualified_name}', getattr(ctx, 'started', None))
+
+
+    '''
+    !REST_STATS:
+    Show queue depth and wait times for the REST scheduler.
+    Mainly used for debugging purposes.
+    '''
+    @commands.command()
+    @commands.guild_only()
+    async def rest_stats(self, ctx):
+        try:
+            # check for admin status
+            if ctx.author.id != gcp_secrets.get_admin_user_id():
+                return
+
+            stats = rest_scheduler.stats()
+            response = (
+                f"queued: interaction {stats['queued'][rest_scheduler.INTERACTION]}"
+                f" | normal {stats['queued'][rest_scheduler.NORMAL]}"
+                f" | background {stats['queued'][rest_scheduler.BACKGROUND]}"
+                f"\nguilds waiting: {stats['guildsWaiting']}"
+                f"\ncompleted: {stats['completed']} | rate limited: {stats['rateLimited']} ({stats['retryAfterTotal']:.1f}s retry after)"
+                f"\nwait p50: {stats['waitP50']:.3f}s | wait max: {stats['waitMax']:.3f}s"
+            )
+            await rest_scheduler.submit(ctx.guild.id, ctx.send, response)
+
+        except Exception as e:
+            logger.write_log(
+                action='!rest_stats',
+                payload=e,
+                severity='Error'
+            )
+
+
+    '''
+    !TRANSLATE_STATS:
+    Show how many translations were served from the cache or skipped by local detection instead of calling the translate API.
+    '''
+    @commands.command()
+    @commands.guild_only()
+    async def translate_stats(self, ctx):
+        try:
+            # check for admin status
+            if ctx.author.id != gcp_secrets.get_admin_user_id():
+                return
+
+            stats = translate_cache.stats()
+            detectStats = language_id.stats()
+            response = (
+                f"translation cache: {stats['hits']} memory hit(s) | {stats['diskHits']} disk hit(s) | {stats['misses']} miss(es)"
+                f"\nhit ratio: {stats['hitRatio']:.1%} | entries in memory: {stats['size']}"
+                f"\nlocal detection: {detectStats['checked']} checked | {detectStats['avoided']} API call(s) avoided | {detectStats['hinted']} source hint(s)"
+            )
+            autoTranslate = self.bot.get_cog('AutoTranslate')
+            if autoTranslate:
+                response += f"\nauto translate: {autoTranslate.skipped} message(s) skipped because their channel's queue was full"
+
+            await rest_scheduler.submit(ctx.guild.id, ctx.send, response)
+
+        except Exception as e:
+            logger.write_log(
+                action='!translate_stats',
+                payload=e,
+                severity='Error'
+            )
+
+
+    '''
+    !SHARDS:
+    Show latency, event rate and connection events for every shard in this process.
+    '''
+    @commands.command()
+    @commands.guild_only()
+    async def shards(self, ctx):
+        try:
+            # check for admin status
+            if ctx.author.id != gcp_secrets.get_admin_user_id():
+                return
+
+            lines = [f"shard {ctx.guild.shard_id} handles this server. this process runs {len(self.bot.shards)} of {self.bot.shard_count} shard(s)"]
+            for shardID, stats in sharding.stats(self.bot).items():
+                latency = 'closed' if stats['closed'] else f"{stats['latency'] * 1000:.0f}ms"
+                lines.append(
+                    f"shard {shardID}: {latency} | {stats['eventRate']:.1f} events/s | {stats['events']} events"
+                    f" | connects {stats['connects']} | disconnects {stats['disconnects']} | resumes {stats['resumes']}"
+                )
+            await rest_scheduler.submit(ctx.guild.id, ctx.send, '\n'.join(lines))
+
+        except Exception as e:
+            logger.write_log(
+                action='!shards',
+                payload=e,
+                severity='Error'
+            )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Diagnostics(bot))
@@ -0,0 +1,65 @@
+from discord.ext import commands, tasks
+
+# py files
+import gateway_recording # recording format
+import logger # used to write logs to google log explorer as well as to stdout
+
+
+class GatewayRecorder(commands.Cog):
+    '''
+    Appends reaction and interaction dispatches to gateway_record_path so bursts can be replayed with bench/replay.py.
+    Does nothing unless gateway_record_path is set. main.py turns on debug events only in that case.
+    '''
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.file = None
+        self.recorded = 0
+
+    async def cog_load(self):
+        if gateway_recording.recordPath:
+            self.file = open(gateway_recording.recordPath, 'a', encoding='utf-8')
+            self.flush_recording.start()
+            logger.write_log(
+                action=None,
+                payload=f'Recording gateway events to {gateway_recording.recordPath}.',
+                severity='Info'
+            )
+
+    async def cog_unload(self):
+        if self.file:
+            self.flush_recording.cancel()
+            self.file.close()
+            self.file = None
+
+    @tasks.loop(seconds=1)
+    async def flush_recording(self):
+        self.file.flush()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # every cog is loaded by now. choice values are safe to record, any other option text is not
+        if self.file is None:
+            return
+        for command in self.bot.tree.walk_commands():
+            for parameter in getattr(command, 'parameters', []):
+                gateway_recording.choiceValues.update(choice.value for choice in parameter.choices)
+
+    @commands.Cog.listener()
+    async def on_socket_raw_receive(self, msg):
+        if self.file is None or not isinstance(msg, str):
+            return
+        try:
+            line = gateway_recording.record_line(msg)
+            if line:
+                self.file.write(line)
+                self.recorded += 1
+        except Exception as e:
+            logger.write_log(
+                action='gateway_recorder',
+                payload=e,
+                severity='Error'
+            )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(GatewayRecorder(bot))
@@ -1,9 +1,10 @@
-import discord
 from discord.ext import commands
 
 # py files
 import firestore # used to talk to firestore
+import role_queue # batches role changes per member into one api call
 import logger # used to write logs to google log explorer as well as to stdout
+import metrics # listener latencies
 
 
 class OnReactionEvents(commands.Cog):
@@ -12,25 +13,24 @@ class OnReactionEvents(commands.Cog):
 
 
     @commands.Cog.listener() # required for discord to recognize this event occured
+    @metrics.timed_listener
     async def on_raw_reaction_add(self, payload):
         '''
         give a role based on a reaction emoji
         '''
 
-        # get the server_config for a channel from firestore. uses the guild_id from the incoming payload
-        messageId = firestore.get_role_message(payload.guild_id)['messageID']
+        # do nothing if the reaction is on any message that isnt a role message defined in firestore
+        # checked against the in-memory routing index so ordinary chat reactions never cause a lookup
+        if not firestore.is_role_message(payload.message_id):
+            return
 
         # create a guild object used for other things.
         guild = self.bot.get_guild(payload.guild_id)
 
-        # do nothing if the reaction is on any message that isnt the role message defined in firestore
-        if payload.message_id != messageId:
-            return
-
         # look up the associated role in firestore based on the emote from the payload
         # do nothing if the reaction does not match a document in firestore
-        firestoreRoleName = firestore.get_role(payload.guild_id, str(payload.emoji))
-        if firestoreRoleName == None:
+        firestoreRoleID = await firestore.get_role(payload.guild_id, str(payload.emoji), payload.message_id)
+        if firestoreRoleID == None:
             logger.write_log(
                 action='on_raw_reaction_add',
                 payload=f"No Role configured for {str(payload.emoji)}, taking no action.",
@@ -38,43 +38,43 @@ class OnReactionEvents(commands.Cog):
             )
             return
 
-        # assign user the roleName
-        discordRoleName = discord.utils.get(guild.roles, name=firestoreRoleName)
-        await payload.member.add_roles(discordRoleName)
+        # assign user the role. resolved by id so renamed roles still work
+        discordRole = guild.get_role(firestoreRoleID)
+        if discordRole == None:
+            logger.write_log(
+                action='on_raw_reaction_add',
+                payload=f"Role {firestoreRoleID} configured for {str(payload.emoji)} no longer exists, taking no action.",
+                severity='Warning'
+            )
+            return
+        # queued so a burst of reactions from one member becomes a single edit
+        role_queue.queue_role_change(guild, payload.user_id, discordRole.id, add=True)
 
         logger.write_log(
             action='on_raw_reaction_add',
-            payload=f"User {payload.member} emoted {str(payload.emoji)}. Adding role #{firestoreRoleName}.",
+            payload=f"User {payload.member} emoted {str(payload.emoji)}. Adding role #{discordRole.name}.",
             severity='Info'
         )
 
 
     @commands.Cog.listener()
+    @metrics.timed_listener
     async def on_raw_reaction_remove(self, payload):
         '''
         remove a role based on a reaction emoji removal
         '''
 
-        # get the server_config for a channel from firestore. uses the guild_id from the incoming payload
-        messageId = firestore.get_role_message(payload.guild_id)['messageID']
+        # do nothing if the reaction is on any message that isnt a role message defined in the config
+        if not firestore.is_role_message(payload.message_id):
+            return
 
         # create a guild object used for other things.
         guild = self.bot.get_guild(payload.guild_id)
 
-        # do nothing if the reaction is on any message that isnt the role message defined in the config
-        if payload.message_id != messageId:
-            return
-
-        # the remove_roles requires a memberid
-        member_id = guild.get_member(payload.user_id)
-
-        # get the member's name as well
-        member = await guild.fetch_member(payload.user_id)
-
         # look up the associated role in firestore based on the emote from the payload
         # do nothing if the reaction does not match a document in firestore
-        firestoreRoleName = firestore.get_role(payload.guild_id, str(payload.emoji))
-        if firestoreRoleName == None:
+        firestoreRoleID = await firestore.get_role(payload.guild_id, str(payload.emoji), payload.message_id)
+        if firestoreRoleID == None:
             logger.write_log(
                 action='on_raw_reaction_remove',
                 payload=f'No Role configured for {str(payload.emoji)}, taking no action.',
@@ -82,15 +82,34 @@ class OnReactionEvents(commands.Cog):
             )
             return
 
-        # assign user the roleName
-        discordRoleName = discord.utils.get(guild.roles, name=firestoreRoleName)
-        await member_id.remove_roles(discordRoleName)
+        # remove the role from the user. resolved by id so renamed roles still work
+        discordRole = guild.get_role(firestoreRoleID)
+        if discordRole == None:
+            logger.write_log(
+                action='on_raw_reaction_remove',
+                payload=f'Role {firestoreRoleID} configured for {str(payload.emoji)} no longer exists, taking no action.',
+                severity='Warning'
+            )
+            return
+        role_queue.queue_role_change(guild, payload.user_id, discordRole.id, add=False)
+
+        # the name is only for the log, a member the gateway cache doesn't hold is logged by id instead of fetched
+        member = guild.get_member(payload.user_id) or payload.user_id
         logger.write_log(
             action='on_raw_reaction_remove',
-            payload=f'User {member} removed emote {str(payload.emoji)}. Removing role #{firestoreRoleName}.',
+            payload=f'User {member} removed emote {str(payload.emoji)}. Removing role #{discordRole.name}.',
             severity='Info'
         )
 
 
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_guild_remove(self, guild):
+        '''
+        stop listening for role config changes on a guild the bot is no longer in
+        '''
+        firestore.unwatch_guild(guild.id)
+
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(OnReactionEvents(bot))
\ No newline at end of file
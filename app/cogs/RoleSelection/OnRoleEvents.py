@@ -0,0 +1,49 @@
+from discord.ext import commands
+
+# py files
+import role_index # name -> role id lookups without scanning guild.roles
+import metrics # listener latencies
+
+
+class OnRoleEvents(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_guild_available(self, guild):
+        '''
+        rebuild a guild's role name index whenever the guild (re)joins the gateway cache
+        '''
+        role_index.build(guild)
+
+
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_guild_remove(self, guild):
+        role_index.forget(guild)
+
+
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_guild_role_create(self, role):
+        role_index.add(role)
+
+
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_guild_role_delete(self, role):
+        role_index.remove(role)
+
+
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_guild_role_update(self, before, after):
+        if before.name != after.name:
+            role_index.remove(before)
+            role_index.add(after)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(OnRoleEvents(bot))
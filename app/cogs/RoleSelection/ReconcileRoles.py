@@ -0,0 +1,88 @@
+import os
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+# py files
+import gcp_secrets # function to retrieve discord private key from gcp secret manager
+import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+import reconcile # applies reactions missed while the bot was offline
+
+
+class ReconcileRoles(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.onConnect = os.getenv('reconcile_on_connect', 'true').lower() == 'true'
+        # roles held without a reaction may have been given by hand, only remove them at connect if asked to
+        self.revokeOnConnect = os.getenv('reconcile_revoke_on_connect', 'false').lower() == 'true'
+        self.reconciledShards = set() # shards already reconciled by this process
+
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        '''
+        reactions made while the process was down were never seen, catch up once when each shard is first ready
+        its guilds are chunked by now so role holders are complete
+        later sessions of the same shard are left to /reconcile_roles, a reconnect storm would page every role message again
+        '''
+        if not self.onConnect or shard_id in self.reconciledShards:
+            return
+        self.reconciledShards.add(shard_id)
+        guilds = [guild for guild in self.bot.guilds if guild.shard_id == shard_id]
+        logger.write_log(
+            action='reconcile',
+            payload=f"Shard {shard_id} is ready, reconciling roles for {len(guilds)} guild(s){'' if self.revokeOnConnect else ', grants only'}.",
+            severity='Debug'
+        )
+        await reconcile.reconcile_guilds(guilds, revoke=self.revokeOnConnect)
+
+
+    '''
+    /RECONCILE_ROLES:
+    Give and remove roles so they match the reactions on every role message of the server.
+    '''
+    @app_commands.command(name="reconcile_roles", description="Match everyone's roles to their reactions on the role messages.")
+    @app_commands.describe(
+        dry_run="Only report what would change",
+        revoke_unreacted="Also remove roles whose emote has no reactions at all, e.g. after the reactions were cleared"
+    )
+    async def reconcile_roles(self, interaction: discord.Interaction, dry_run: bool = False, revoke_unreacted: bool = False):
+        try:
+            logger.write_log(
+                action='/reconcile_roles',
+                payload=f'User {interaction.user} invoked the /reconcile_roles command.',
+                severity='Debug'
+            )
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+            # check for admin status
+            if interaction.user.id != gcp_secrets.get_admin_user_id():
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            stats = await reconcile.reconcile_guild(interaction.guild, dryRun=dry_run, revokeUnreacted=revoke_unreacted)
+            response = (
+                f"checked {stats['messages']} role message(s) and {stats['reactors']} reaction(s) in {stats['seconds']}s. "
+                f"{stats['grants']} role(s) to give and {stats['revokes']} to remove across {stats['members']} member(s)"
+            )
+            if not dry_run:
+                response += f", {stats['applied']} member(s) updated"
+            if stats['unreactedRoles']:
+                response += f". {stats['unreactedRoles']} role(s) have no reactions on their emote and were not removed from anyone, use revoke_unreacted:True to remove them"
+            if stats['errors']:
+                response += '. Skipped: ' + '; '.join(stats['errors'])
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/reconcile_roles',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /reconcile_roles; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(ReconcileRoles(bot))
@@ -6,6 +6,7 @@ from discord import app_commands
 import gcp_secrets # function to retrieve discord private key from gcp secret manager
 import firestore # used to talk to firestore
 import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
 
 
 class SetRoleMessage(commands.Cog):
@@ -20,7 +21,8 @@ class SetRoleMessage(commands.Cog):
     @app_commands.command(name="set_role_message", description="Create a message in the current channel for role selection.")
     @app_commands.describe(title="What is the title of your welcome message? ex: Welcome to my channel!")
     @app_commands.describe(description="What is the description of your welcome message? Add more detail than just the title alone. ex: Here are instructions")
-    async def set_role_message(self, interaction: discord.Interaction, title: str, description: str):
+    @app_commands.describe(additional="Add another role message instead of replacing the main one. ex: one message per game or region")
+    async def set_role_message(self, interaction: discord.Interaction, title: str, description: str, additional: bool = False):
         try:
             logger.write_log(
             action='/set_role_message',
@@ -33,16 +35,18 @@ class SetRoleMessage(commands.Cog):
                 colour=discord.Color.dark_teal(),
                 title=title,
                 description=('Use /add_role to add new role|emote combinations in your channel. '
-                             'You can only have one role selection message active at a time, '
-                             'so using /set_role_message again will replace this message with the description you provided.'
+                             'Using /set_role_message again will replace the main role message with the description you provided. '
+                             'Use /set_role_message with additional to add more role messages, and pass their message ID to /add_role.'
                 )
                 # initial embed will tell the user to add new roles       
             )
-            await interaction.response.send_message(embed=embed)
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.send_message, embed=embed, priority=rest_scheduler.INTERACTION)
             # get the messageID for this role_message
-            message = await interaction.original_response()
+            message = await rest_scheduler.submit(interaction.guild_id, interaction.original_response, priority=rest_scheduler.INTERACTION)
             # add messageID to firestore
-            firestore.set_role_message(interaction.guild_id, message.id, interaction.channel_id, title, description)
+            await firestore.set_role_message(interaction.guild_id, message.id, interaction.channel_id, title, description, additional)
+            if additional:
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Added a role message. Use message ID {message.id} with /add_role and /remove_role.", ephemeral=True, priority=rest_scheduler.INTERACTION)
 
         except Exception as e:
             logger.write_log(
@@ -50,12 +54,49 @@ class SetRoleMessage(commands.Cog):
                 payload=e,
                 severity='Error'
             )
-            admin_user_id = gcp_secrets.get_secret_contents('discord-bot-admin-user-id')
-            adminUser = interaction.guild.get_member(int(admin_user_id))
-            await adminUser.send(f'An error occured in petebot; command /set_role_message; channel {interaction.channel_id}; {e}')
-            await interaction.followup.send(f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True)
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /set_role_message; channel {interaction.channel_id}; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
             return
 
 
+
+    '''
+    /REMOVE_ROLE_MESSAGE:
+    Stop using an additional role message and delete its roles.
+    '''
+    @app_commands.command(name="remove_role_message", description="Remove an additional role selection message and all of its roles.")
+    @app_commands.describe(message_id="ID of the role message to remove")
+    async def remove_role_message(self, interaction: discord.Interaction, message_id: str):
+        try:
+            logger.write_log(
+                action='/remove_role_message',
+                payload=f'User {interaction.user} invoked the /remove_role_message command.',
+                severity='Debug'
+            )
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+            # check for admin status
+            if interaction.user.id != gcp_secrets.get_admin_user_id():
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            if not message_id.isdigit():
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{message_id} is not a valid message ID.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            response = await firestore.remove_role_message(interaction.guild_id, int(message_id))
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/remove_role_message',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /remove_role_message; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(SetRoleMessage(bot))
\ No newline at end of file
@@ -3,6 +3,7 @@ from discord.ext import commands
 # py files
 import firestore # used to talk to firestore
 import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
 
 
 class ShowRoles(commands.Cog):
@@ -19,17 +20,20 @@ class ShowRoles(commands.Cog):
     @commands.command()
     async def show_roles(self, ctx):
         try:
-            role_list = firestore.show_roles(ctx.message.guild.id)
+            message_list = await firestore.list_role_messages(ctx.message.guild.id)
             # if roles exist
-            if role_list:
+            if any(role_list for config, role_list in message_list):
                 response = ''
-                for dict in role_list:
-                    #for i in dict:
-                    response += f'\n {dict["roleEmote"]} | #{dict["roleName"]}'
+                for config, role_list in message_list:
+                    # group the roles by the role message they are on
+                    response += f'\n{config["messageTitle"]} (message {config["messageID"]}):'
+                    for dict in role_list:
+                        #for i in dict:
+                        response += f'\n {dict["roleEmote"]} | #{dict["roleName"]}'
                 response = f'The following emote/roles are set for this server:{response}'
             else:
                 response = 'There are currently no emote/roles set for this server. Add one using /add_role.'
-            await ctx.send(f"Hello {ctx.message.author}, {response}")
+            await rest_scheduler.submit(ctx.guild.id, ctx.send, f"Hello {ctx.message.author}, {response}")
         
         except Exception as e:
             logger.write_log(
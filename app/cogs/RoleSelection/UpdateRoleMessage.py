@@ -1,11 +1,67 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
+import asyncio
+import csv
+import hashlib
+import io
+import json
 
 # py files
 import gcp_secrets # function to retrieve discord private key from gcp secret manager
 import firestore # used to talk to firestore
+import role_index # name -> role id lookups without scanning guild.roles
 import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+
+maxImportBytes = 256 * 1024 # largest /import_roles attachment accepted
+maxReactions = 20 # discord allows 20 different reactions on one message
+
+
+def parse_role_file(filename, data):
+    '''
+    Read emote/role pairs from an /import_roles attachment. Returns [(emote, roleName)], later rows win.
+    JSON: a list of {"emote": ..., "role": ...} (the /export_roles format) or an {emote: role} object
+    CSV: emote,role rows with an optional header row
+    Raises ValueError with a message for the user if the file can't be read.
+    '''
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError('the file is not UTF-8 text.')
+
+    pairs = []
+    if filename.lower().endswith('.json'):
+        try:
+            parsed = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'the file is not valid JSON ({e}).')
+        if isinstance(parsed, dict):
+            pairs = list(parsed.items())
+        elif isinstance(parsed, list) and all(isinstance(row, dict) for row in parsed):
+            pairs = [(row.get('emote', row.get('roleEmote')), row.get('role', row.get('roleName'))) for row in parsed]
+        else:
+            raise ValueError('JSON must be a list of {"emote": ..., "role": ...} objects or an {emote: role} object.')
+    elif filename.lower().endswith('.csv'):
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+        if rows and rows[0][0].strip().lower() in ('emote', 'roleemote'):
+            rows = rows[1:]
+        if any(len(row) < 2 for row in rows):
+            raise ValueError('every CSV row needs an emote and a role.')
+        pairs = [(row[0], row[1]) for row in rows]
+    else:
+        raise ValueError('attach a .json or .csv file.')
+
+    roles = {}
+    for emote, roleName in pairs:
+        if not isinstance(emote, str) or not isinstance(roleName, str) or not emote.strip() or not roleName.strip():
+            raise ValueError(f'every entry needs an emote and a role, found {emote!r} | {roleName!r}.')
+        if '/' in emote:
+            raise ValueError(f'{emote} is not a valid emote.')
+        roles[emote.strip()] = roleName.strip()
+    if not roles:
+        raise ValueError('the file has no roles in it.')
+    return list(roles.items())
 
 
 class UpdateRoleMessage(commands.Cog):
@@ -13,51 +69,92 @@ class UpdateRoleMessage(commands.Cog):
         self.bot = bot
 
     def check_admin_status(self, user_id):
-        admin_user_id = gcp_secrets.get_secret_contents('discord-bot-admin-user-id')
-        if user_id != int(admin_user_id):
+        # read from memory, secrets are prefetched at startup
+        if user_id != gcp_secrets.get_admin_user_id():
             return False
         return True
     
-    async def check_for_message(self, interaction): 
+    async def check_for_message(self, interaction, message_id=None): 
         # init occurs when the cog is loaded. We want something to run when the /command is called
-        messageDict = firestore.get_role_message(interaction.guild_id)
+        # message_id picks one of the server's role messages, None is the main role message
+        if message_id and not message_id.isdigit():
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{message_id} is not a valid message ID.", priority=rest_scheduler.INTERACTION)
+            return None, None
+        messageDict = await firestore.get_role_message(interaction.guild_id, int(message_id) if message_id else None)
         if not messageDict:
-            await interaction.followup.send(f"A role message has not been defined for this server. Please create a role selection message by using /set_role_message")
-            return
+            if message_id:
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Message {message_id} is not a role message in this server. Create one by using /set_role_message", priority=rest_scheduler.INTERACTION)
+            else:
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"A role message has not been defined for this server. Please create a role selection message by using /set_role_message", priority=rest_scheduler.INTERACTION)
+            return None, None
         try:
             channel = self.bot.get_channel(messageDict['channelID'])
-            message = await channel.fetch_message(messageDict['messageID'])
+            message = await rest_scheduler.submit(interaction.guild_id, channel.fetch_message, messageDict['messageID'])
         except discord.errors.NotFound: #if a NotFound error appears, the message is either not in this channel or deleted
-            await interaction.followup.send(f"The channel or message originally set with /set_role_message no longer exists. Please create a new role selection message by using /set_role_message")
-            return
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"The channel or message originally set with /set_role_message no longer exists. Please create a new role selection message by using /set_role_message", priority=rest_scheduler.INTERACTION)
+            return None, None
         return messageDict, message
     
+    async def over_reaction_limit(self, interaction, messageDict, emotes):
+        '''
+        Checked before anything is written. Returns True and tells the user if adding emotes would put more than
+        maxReactions different emotes on the role message, firestore and the message would otherwise end up out of sync.
+        '''
+        configured = {role['roleEmote'] for role in await firestore.show_roles(interaction.guild_id, messageDict['messageID'])}
+        total = len(configured | set(emotes))
+        if total <= maxReactions:
+            return False
+        await rest_scheduler.submit(
+            interaction.guild_id, interaction.followup.send,
+            f"A message can only have {maxReactions} different reactions. This would put {total} emotes on message {messageDict['messageID']}, "
+            f"which has room for {max(0, maxReactions - len(configured))} more. Nothing was changed. "
+            f"Spread the roles across more messages: create one with /set_role_message additional:True and pass its message_id.",
+            ephemeral=True, priority=rest_scheduler.INTERACTION
+        )
+        return True
+
+    def embed_hash(self, title, description):
+        # fingerprint of the rendered embed, used to skip edits that wouldn't change anything
+        return hashlib.sha256(f'{title}\0{description}'.encode('utf-8')).hexdigest()
+
     async def update_role_message(self, interaction, messageDict, message):
         '''
         interaction: discord interaction object
         messageDict: dictionary of message data from firestore
         message: discord message object to edit
+        Only sends what changed. The embed is edited if its content changed, missing reactions are added
+        and reactions for emotes that no longer have a role are cleared.
         '''
-        # update the description of the role message by editing the existing message
-        # first, get a list of roles for the description. We need to recreate the message entirely
-        role_list = firestore.show_roles(interaction.guild_id)
+        # first, get a list of roles for the description. served from the role cache
+        role_list = await firestore.show_roles(interaction.guild_id, messageDict['messageID'])
         # if roles exist, add them first to description
         description = messageDict['messageDescription'] + '\n---'
         for dict in role_list:
             description += f'\n{dict["roleEmote"]} | <@&{dict["roleID"]}>'
 
-        # update the message
-        embed = discord.Embed(
-            colour=discord.Color.dark_teal(),
-            title=messageDict['messageTitle'],
-            description=description
-            # initial embed will tell the user to add new roles       
-            )
-        await message.edit(embed=embed)
+        # update the message only if the rendered embed is different from the one on the message
+        current = message.embeds[0] if message.embeds else None
+        if not current or self.embed_hash(current.title, current.description) != self.embed_hash(messageDict['messageTitle'], description):
+            embed = discord.Embed(
+                colour=discord.Color.dark_teal(),
+                title=messageDict['messageTitle'],
+                description=description
+                # initial embed will tell the user to add new roles       
+                )
+            await rest_scheduler.submit(interaction.guild_id, message.edit, embed=embed)
 
-        # add an emote to the role message for each role in role_list
-        for dict in role_list:
-            await message.add_reaction(dict['roleEmote'])
+        # diff the emotes on the message against the configured emotes
+        desiredEmotes = [dict['roleEmote'] for dict in role_list]
+        botEmotes = {str(reaction.emoji) for reaction in message.reactions if reaction.me}
+        staleReactions = [reaction.emoji for reaction in message.reactions if str(reaction.emoji) not in desiredEmotes]
+
+        # clear reactions for emotes that were removed
+        await asyncio.gather(*[rest_scheduler.submit(interaction.guild_id, message.clear_reaction, emoji) for emoji in staleReactions])
+
+        # add missing emotes one at a time so they appear in the same order as the description
+        for emote in desiredEmotes:
+            if emote not in botEmotes:
+                await rest_scheduler.submit(interaction.guild_id, message.add_reaction, emote)
 
     '''
     /ADD_ROLE:
@@ -66,7 +163,8 @@ class UpdateRoleMessage(commands.Cog):
     @app_commands.command(name="add_role", description="Create a new role/emote combination on the role selection message.")
     @app_commands.describe(emote="Emote used to gain that role")
     @app_commands.describe(role="Name of role in discord (role will be created if it does not exist)")
-    async def add_role(self, interaction: discord.Interaction, emote: str, role: str):
+    @app_commands.describe(message_id="ID of the role message to add to. Leave empty for the main role message")
+    async def add_role(self, interaction: discord.Interaction, emote: str, role: str, message_id: str = None):
         try:
             logger.write_log(
                 action='/add_role',
@@ -74,11 +172,11 @@ class UpdateRoleMessage(commands.Cog):
                 severity='Debug'
             )
             # message can take longer than 3 second timeout. defer for 5 seconds
-            await interaction.response.defer(ephemeral=True)
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
 
             # check for admin status
             if not self.check_admin_status(interaction.user.id):
-                await interaction.response.send_message(f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True)
+                await rest_scheduler.submit(interaction.guild_id, interaction.response.send_message, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
                 logger.write_log(
                     action='Check Admin Status',
                     payload=f'User {interaction.user.name} was blocked from using the /remove_role command',
@@ -88,20 +186,21 @@ class UpdateRoleMessage(commands.Cog):
 
             # get existing message data from firestore
             # if either are none, exception already handled in check_for_message
-            messageDict, message = await self.check_for_message(interaction)
+            messageDict, message = await self.check_for_message(interaction, message_id)
             if not messageDict or not message:
                 return
+            if await self.over_reaction_limit(interaction, messageDict, [emote]):
+                return
 
             # check if a discord role exists. if it does not, create one
-            existingRole = discord.utils.get(interaction.guild.roles, name=str(role).lower())
+            existingRole = role_index.get_role_by_name(interaction.guild, str(role).lower())
             if not existingRole: # if a role doesnt exist, create one
-                await interaction.guild.create_role(name=str(role).lower())
+                existingRole = await rest_scheduler.submit(interaction.guild_id, interaction.guild.create_role, name=str(role).lower())
 
             # update firestore
-            roleID = discord.utils.get(interaction.guild.roles, name=str(role).lower())
-            response = firestore.add_role(interaction.guild_id, emote, role, roleID.id) # attempts to add role. If response returns it was successful            
+            response = await firestore.add_role(interaction.guild_id, emote, role, existingRole.id, messageDict['messageID']) # attempts to add role. If response returns it was successful            
             await self.update_role_message(interaction, messageDict, message)
-            await interaction.followup.send(f"Hello {interaction.user.name}, {response}", ephemeral=True)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}", ephemeral=True, priority=rest_scheduler.INTERACTION)
 
         except Exception as e:
             logger.write_log(
@@ -109,10 +208,9 @@ class UpdateRoleMessage(commands.Cog):
                 payload=e,
                 severity='Error'
             )
-            admin_user_id = gcp_secrets.get_secret_contents('discord-bot-admin-user-id')
-            adminUser = interaction.guild.get_member(int(admin_user_id))
-            await adminUser.send(f'An error occured in petebot; command /add_role; {e}')
-            await interaction.followup.send(f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True)
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /add_role; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
             return
 
     '''
@@ -122,18 +220,19 @@ class UpdateRoleMessage(commands.Cog):
     '''
     @app_commands.command(name="remove_role", description="Remove role/emote combination for this channel")
     @app_commands.describe(emote="Emote used to gain that role")
-    async def remove_role(self, interaction: discord.Interaction, emote: str):
+    @app_commands.describe(message_id="ID of the role message to remove from. Leave empty for the main role message")
+    async def remove_role(self, interaction: discord.Interaction, emote: str, message_id: str = None):
         try:
             logger.write_log(
                 action='/remove_role',
                 payload=f'User {interaction.user.name} invoked the /remove_role command',
                 severity='Debug'
             )
-            await interaction.response.defer(ephemeral=True)
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
 
             # check for admin status
             if not self.check_admin_status(interaction.user.id):
-                await interaction.response.send_message(f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True)
+                await rest_scheduler.submit(interaction.guild_id, interaction.response.send_message, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
                 logger.write_log(
                     action='Check Admin Status',
                     payload=f'User {interaction.user.name} was blocked from using the /remove_role command',
@@ -143,16 +242,16 @@ class UpdateRoleMessage(commands.Cog):
 
             # get existing message data from firestore
             # if either are none, exception already handled in check_for_message
-            messageDict, message = await self.check_for_message(interaction)
+            messageDict, message = await self.check_for_message(interaction, message_id)
             if not messageDict or not message:
                 return
 
             # remove the role from firestore
-            response = firestore.remove_role(interaction.guild_id, emote)
+            response = await firestore.remove_role(interaction.guild_id, emote, messageDict['messageID'])
             # update the role message
             await self.update_role_message(interaction, messageDict, message)
             # respond to the user
-            await interaction.followup.send(f"Hello {interaction.user.name}, {response}", ephemeral=True)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}", ephemeral=True, priority=rest_scheduler.INTERACTION)
 
         except Exception as e:
             logger.write_log(
@@ -160,12 +259,142 @@ class UpdateRoleMessage(commands.Cog):
                 payload=e,
                 severity='Error'
             )
-            admin_user_id = gcp_secrets.get_secret_contents('discord-bot-admin-user-id')
-            adminUser = interaction.guild.get_member(int(admin_user_id))
-            await adminUser.send(f'An error occured in petebot; command /remove_role; {e}')
-            await interaction.followup.send(f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True)
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /remove_role; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
             return
 
 
+    '''
+    /IMPORT_ROLES:
+    Add every emote/role pair from a JSON or CSV attachment in one go.
+    Missing discord roles are created concurrently, firestore is written in batches and the role message is refreshed once.
+    '''
+    @app_commands.command(name="import_roles", description="Add many role/emote combinations from a JSON or CSV file.")
+    @app_commands.describe(file="JSON list of {\"emote\": ..., \"role\": ...} or CSV rows of emote,role")
+    @app_commands.describe(message_id="ID of the role message to add to. Leave empty for the main role message")
+    async def import_roles(self, interaction: discord.Interaction, file: discord.Attachment, message_id: str = None):
+        try:
+            logger.write_log(
+                action='/import_roles',
+                payload=f'User {interaction.user.name} invoked the /import_roles command',
+                severity='Debug'
+            )
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+            # check for admin status
+            if not self.check_admin_status(interaction.user.id):
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                logger.write_log(
+                    action='Check Admin Status',
+                    payload=f'User {interaction.user.name} was blocked from using the /import_roles command',
+                    severity='Debug'
+                )
+                return
+
+            if file.size > maxImportBytes:
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{file.filename} is too large. Files up to {maxImportBytes // 1024}KB can be imported.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+            try:
+                pairs = parse_role_file(file.filename, await file.read())
+            except ValueError as e:
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Could not import {file.filename}: {e}", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            # get existing message data from firestore
+            # if either are none, exception already handled in check_for_message
+            messageDict, message = await self.check_for_message(interaction, message_id)
+            if not messageDict or not message:
+                return
+            if await self.over_reaction_limit(interaction, messageDict, [emote for emote, roleName in pairs]):
+                return
+
+            # create every missing discord role at once. the scheduler keeps the requests within the rate limits
+            roleNames = {roleName.lower() for emote, roleName in pairs}
+            existingRoles = {name: role_index.get_role_by_name(interaction.guild, name) for name in roleNames}
+            missingNames = [name for name, role in existingRoles.items() if not role]
+            createdRoles = await asyncio.gather(*[rest_scheduler.submit(interaction.guild_id, interaction.guild.create_role, name=name) for name in missingNames])
+            existingRoles.update(zip(missingNames, createdRoles))
+
+            # update firestore with batched writes, then refresh the role message once
+            roles = [(emote, roleName, existingRoles[roleName.lower()].id) for emote, roleName in pairs]
+            response = await firestore.add_roles(interaction.guild_id, roles, messageDict['messageID'])
+            if isinstance(response, str):
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+            await self.update_role_message(interaction, messageDict, message)
+
+            created, updated = response
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, imported {len(roles)} role(s) from {file.filename}. {created} new, {updated} updated, {len(missingNames)} discord role(s) created.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/import_roles',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /import_roles; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+            return
+
+    '''
+    /EXPORT_ROLES:
+    Send the emote/role pairs of a role message as a file /import_roles accepts.
+    '''
+    @app_commands.command(name="export_roles", description="Download the role/emote combinations of a role message.")
+    @app_commands.describe(file_format="File type to export")
+    @app_commands.describe(message_id="ID of the role message to export. Leave empty for the main role message")
+    @app_commands.choices(file_format=[
+        app_commands.Choice(name="JSON", value="json"),
+        app_commands.Choice(name="CSV", value="csv")
+    ])
+    async def export_roles(self, interaction: discord.Interaction, file_format: app_commands.Choice[str] = None, message_id: str = None):
+        try:
+            logger.write_log(
+                action='/export_roles',
+                payload=f'User {interaction.user.name} invoked the /export_roles command',
+                severity='Debug'
+            )
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+            # check for admin status
+            if not self.check_admin_status(interaction.user.id):
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            if message_id and not message_id.isdigit():
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{message_id} is not a valid message ID.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+            messageDict = await firestore.get_role_message(interaction.guild_id, int(message_id) if message_id else None)
+            if not messageDict:
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"No role message found. Please create a role selection message by using /set_role_message", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+            role_list = await firestore.show_roles(interaction.guild_id, messageDict['messageID'])
+
+            extension = file_format.value if file_format else 'json'
+            if extension == 'csv':
+                output = io.StringIO()
+                writer = csv.writer(output)
+                writer.writerow(['emote', 'role'])
+                writer.writerows([dict['roleEmote'], dict['roleName']] for dict in role_list)
+                content = output.getvalue()
+            else:
+                content = json.dumps([{'emote': dict['roleEmote'], 'role': dict['roleName']} for dict in role_list], ensure_ascii=False, indent=2)
+
+            exportFile = discord.File(io.BytesIO(content.encode('utf-8')), filename=f"roles-{messageDict['messageID']}.{extension}")
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, here are the {len(role_list)} role(s) on {messageDict['messageTitle']}.", file=exportFile, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/export_roles',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /export_roles; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+            return
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(UpdateRoleMessage(bot))
\ No newline at end of file
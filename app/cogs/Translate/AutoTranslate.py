@@ -0,0 +1,264 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+import os
+
+# py files
+import gcp_translate # translating in google translation api
+import firestore # used to talk to firestore
+import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+import gcp_secrets # used to get secrets from google secret manager
+import metrics # listener latencies
+from cogs.Translate.Translate import multiLanguageChoices
+
+windowSeconds = float(os.getenv('auto_translate_window', '2')) # how long to collect messages before translating them
+maxBatch = int(os.getenv('auto_translate_batch', '25')) # messages sent to the API in one request
+# characters sent to the API in one request. translate v2 rejects requests much over 30k codepoints
+maxBatchChars = int(os.getenv('auto_translate_batch_chars', '25000'))
+maxQueued = int(os.getenv('auto_translate_queue', '100')) # messages waiting per channel before new ones are skipped
+
+
+def take_batch(queue):
+    '''
+    Remove and return the next batch from a channel's queue, at most maxBatch messages and maxBatchChars characters.
+    A single message over maxBatchChars goes out alone.
+    '''
+    count = 0
+    chars = 0
+    for message in queue[:maxBatch]:
+        if count and chars + len(message.content) > maxBatchChars:
+            break
+        count += 1
+        chars += len(message.content)
+    batch = queue[:count]
+    del queue[:count]
+    return batch
+
+
+class AutoTranslate(commands.Cog):
+    '''
+    Channels flagged as auto translate have every message translated without anyone running /translate.
+    Messages are collected per channel for a short window and sent to the API as one multi string request per language.
+    Batches are capped by message count and by total characters. A request that fails is split in half and retried,
+    so one bad or oversized message only loses its own translation.
+    Only one batch per channel is in flight at a time. If a channel outpaces the API its queue fills up
+    and new messages are skipped until it drains.
+    '''
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.queues = {} # format: {channelID: [messages waiting to be translated]}
+        self.flushes = {} # format: {channelID: task translating that channel's queue}
+        self.skipped = 0 # messages dropped because their channel's queue was full, shown by !translate_stats
+
+    def check_admin_status(self, user_id):
+        # read from memory, secrets are prefetched at startup
+        if user_id != gcp_secrets.get_admin_user_id():
+            return False
+        return True
+
+
+    @commands.Cog.listener()
+    @metrics.timed_listener
+    async def on_message(self, message):
+        '''
+        queue messages from auto translate channels
+        '''
+        if message.author.bot or not message.guild or not message.content:
+            return
+
+        # served from memory after the first message in a guild
+        channels = await firestore.get_auto_translate_channels(message.guild.id)
+        if message.channel.id not in channels:
+            return
+
+        queue = self.queues.setdefault(message.channel.id, [])
+        if len(queue) >= maxQueued:
+            self.skipped += 1
+            logger.write_log(
+                action='auto_translate',
+                payload=f'Channel {message.channel.id} has {len(queue)} messages waiting. Skipping message {message.id}.',
+                severity='Warning'
+            )
+            return
+        queue.append(message)
+
+        if message.channel.id not in self.flushes:
+            self.flushes[message.channel.id] = asyncio.ensure_future(self.flush_channel(message.guild.id, message.channel.id))
+
+
+    async def flush_channel(self, guildID, channelID):
+        queue = self.queues[channelID]
+        try:
+            while queue:
+                # a full batch goes straight out, otherwise wait for the window to collect more
+                if len(queue) < maxBatch and sum(len(message.content) for message in queue) < maxBatchChars:
+                    await asyncio.sleep(windowSeconds)
+                batch = take_batch(queue)
+
+                # the channel may have been turned off while messages were waiting
+                languages = (await firestore.get_auto_translate_channels(guildID)).get(channelID)
+                if languages:
+                    await self.translate_batch(guildID, batch, languages)
+        except Exception as e:
+            logger.write_log(
+                action='auto_translate',
+                payload=e,
+                severity='Error'
+            )
+        finally:
+            self.flushes.pop(channelID, None)
+            if not queue:
+                self.queues.pop(channelID, None)
+
+
+    async def translate_batch(self, guildID, batch, languages):
+        '''
+        Translate a batch of messages into every language with one API request per language, then reply to each message
+        '''
+        texts = [message.content for message in batch]
+        results = await asyncio.gather(*[self.translate_texts(texts, language) for language in languages])
+
+        replies = {} # format: {message: reply task}
+        for i, message in enumerate(batch):
+            '''
+            Format:
+            [Language 1]: [translation]
+            [Language 2]: [translation]
+            '''
+            lines = []
+            for language, languageResults in zip(languages, results):
+                result = languageResults[i]
+                if result is None or result['detectedSourceLanguageISO639'] == language:
+                    continue # failed, or already in this language
+                lines.append(f"{gcp_translate.language_name(language)}: {result['translatedText']}")
+            if lines:
+                replies[message] = self.reply(guildID, message, lines)
+        # one failed reply (message deleted, missing permissions) doesn't stop the others
+        for message, result in zip(replies, await asyncio.gather(*replies.values(), return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.write_log(
+                    action='auto_translate',
+                    payload=f'Failed to reply to message {message.id}. Error: {result}',
+                    severity='Warning'
+                )
+
+        logger.write_log(
+            action='auto_translate',
+            payload=f'Translated {len(batch)} message(s) into {len(languages)} language(s).',
+            severity='Debug'
+        )
+
+
+    async def translate_texts(self, texts, language):
+        '''
+        One API request for texts. If it fails the texts are split in half and each half tried again,
+        a text that still fails on its own comes back as None instead of failing the whole batch
+        '''
+        try:
+            return await gcp_translate.translate_batch(texts, language)
+        except Exception as e:
+            if len(texts) == 1:
+                logger.write_log(
+                    action='auto_translate',
+                    payload=f'Failed to translate a message of {len(texts[0])} character(s) to {language}. Error: {e}',
+                    severity='Warning'
+                )
+                return [None]
+            half = len(texts) // 2
+            first, second = await asyncio.gather(self.translate_texts(texts[:half], language), self.translate_texts(texts[half:], language))
+            return first + second
+
+
+    async def reply(self, guildID, message, lines):
+        # three translations of a long message go over discord's 2000 character limit, the rest follow the reply
+        for i, response in enumerate(gcp_translate.split_reply(lines)):
+            if i == 0:
+                await rest_scheduler.submit(guildID, message.reply, response, mention_author=False)
+            else:
+                await rest_scheduler.submit(guildID, message.channel.send, response)
+
+
+    '''
+    /AUTO_TRANSLATE_ENABLE
+    Translate every message in a channel into up to three languages.
+    '''
+    @app_commands.command(name="auto_translate_enable", description="Translate every message in a channel. Replies to each message with its translations.")
+    @app_commands.describe(channel="Channel to translate")
+    @app_commands.choices(language_1=multiLanguageChoices, language_2=multiLanguageChoices, language_3=multiLanguageChoices)
+    async def auto_translate_enable(
+        self,
+        interaction: discord.Interaction,
+        channel: discord.TextChannel,
+        language_1: app_commands.Choice[str],
+        language_2: app_commands.Choice[str] = None,
+        language_3: app_commands.Choice[str] = None
+    ):
+        try:
+            logger.write_log(
+                action='/auto_translate_enable',
+                payload=f'User {interaction.user.name} invoked the /auto_translate_enable command',
+                severity='Debug'
+            )
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+            # check for admin status
+            if not self.check_admin_status(interaction.user.id):
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            languages = []
+            for choice in [language_1, language_2, language_3]:
+                if choice and choice.value not in languages:
+                    languages.append(choice.value)
+            response = await firestore.set_auto_translate_channel(interaction.guild_id, channel.id, languages)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/auto_translate_enable',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /auto_translate_enable; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+
+    '''
+    /AUTO_TRANSLATE_DISABLE
+    Stop translating messages in a channel.
+    '''
+    @app_commands.command(name="auto_translate_disable", description="Stop translating every message in a channel.")
+    @app_commands.describe(channel="Channel to stop translating")
+    async def auto_translate_disable(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        try:
+            logger.write_log(
+                action='/auto_translate_disable',
+                payload=f'User {interaction.user.name} invoked the /auto_translate_disable command',
+                severity='Debug'
+            )
+            await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+            # check for admin status
+            if not self.check_admin_status(interaction.user.id):
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{interaction.user.name}, you do not have permission to use this command.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+                return
+
+            response = await firestore.remove_auto_translate_channel(interaction.guild_id, channel.id)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello {interaction.user.name}, {response}", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/auto_translate_disable',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /auto_translate_disable; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(AutoTranslate(bot))
@@ -5,8 +5,34 @@ from discord import app_commands
 # py files
 import gcp_translate # translating in google translation api
 import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
 import gcp_secrets # used to get secrets from google secret manager
 
+# languages offered by /translate_multi, one list shared by every target_language option
+multiLanguageChoices = [
+    app_commands.Choice(name="Arabic", value="ar"),
+    app_commands.Choice(name="Bosnian", value="bs"),
+    app_commands.Choice(name="Croatian", value="hr"),
+    app_commands.Choice(name="English", value="en"),
+    app_commands.Choice(name="German", value="de"),
+    app_commands.Choice(name="Finnish", value="fi"),
+    app_commands.Choice(name="Italian", value="it"),
+    app_commands.Choice(name="Japanese", value="ja"),
+    app_commands.Choice(name="Korean", value="ko"),
+    app_commands.Choice(name="Lithuanian", value="lt"),
+    app_commands.Choice(name="Macedonian", value="mk"),
+    app_commands.Choice(name="Polish", value="pl"),
+    app_commands.Choice(name="Portuguese", value="pt"),
+    app_commands.Choice(name="Romanian", value="ro"),
+    app_commands.Choice(name="Russian", value="ru"),
+    app_commands.Choice(name="Serbian", value="sr"),
+    app_commands.Choice(name="Slovenian", value="sl"),
+    app_commands.Choice(name="Spanish", value="es"),
+    app_commands.Choice(name="Swedish", value="sv"),
+    app_commands.Choice(name="Turkish", value="tr"),
+    app_commands.Choice(name="Ukranian", value="uk")
+]
+
 class Translate(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -41,10 +67,10 @@ class Translate(commands.Cog):
             severity='Debug'
         )
         # message can take longer than 3 second timeout. defer
-        await interaction.response.defer()
+        await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, priority=rest_scheduler.INTERACTION)
     
         try:
-            translateDict = gcp_translate.translate_text(text, target_language.value)
+            translateDict = await gcp_translate.translate_text(text, target_language.value)
             '''
             Format:
             EN: [English text]
@@ -52,11 +78,11 @@ class Translate(commands.Cog):
             '''
             # if detected language is english
             if translateDict['detectedSourceLanguageISO639'] == 'en':
-                await interaction.followup.send(f"English: {text}\n{target_language.name}: {translateDict['translatedText']}")
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"English: {text}\n{target_language.name}: {translateDict['translatedText']}", priority=rest_scheduler.INTERACTION)
             elif target_language.value == 'en':
-                await interaction.followup.send(f"English: {translateDict['translatedText']}\n{translateDict['detectedSourceLanguage']}: {text}")
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"English: {translateDict['translatedText']}\n{translateDict['detectedSourceLanguage']}: {text}", priority=rest_scheduler.INTERACTION)
             else:
-                await interaction.followup.send(f"{translateDict['detectedSourceLanguage']}: {text}\n{target_language.name}: {translateDict['translatedText']}")
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"{translateDict['detectedSourceLanguage']}: {text}\n{target_language.name}: {translateDict['translatedText']}", priority=rest_scheduler.INTERACTION)
 
         except Exception as e:
             logger.write_log(
@@ -64,10 +90,9 @@ class Translate(commands.Cog):
                 payload=e,
                 severity='Error'
             )
-            admin_user_id = gcp_secrets.get_secret_contents('discord-bot-admin-user-id')
-            adminUser = interaction.guild.get_member(int(admin_user_id))
-            await adminUser.send(f'An error occured in petebot; command /add_role; {e}')
-            await interaction.followup.send(f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True)
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /add_role; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
 
 
     '''
@@ -106,13 +131,13 @@ class Translate(commands.Cog):
             severity='Debug'
         )
         # message can take longer than 3 second timeout. defer for 5 seconds
-        await interaction.response.defer(ephemeral=True)
+        await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, ephemeral=True, priority=rest_scheduler.INTERACTION)
         # await asyncio.sleep(4) # Doing stuff
 
         try:
-            translateDict = gcp_translate.translate_text(text, target_language.value)
+            translateDict = await gcp_translate.translate_text(text, target_language.value)
 
-            await interaction.followup.send(f"Detected Language: {translateDict['detectedSourceLanguage']}\n{target_language.name}: {translateDict['translatedText']}", ephemeral=True)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Detected Language: {translateDict['detectedSourceLanguage']}\n{target_language.name}: {translateDict['translatedText']}", ephemeral=True, priority=rest_scheduler.INTERACTION)
 
         except Exception as e:
             logger.write_log(
@@ -120,11 +145,74 @@ class Translate(commands.Cog):
                 payload=e,
                 severity='Error'
             )
-            admin_user_id = gcp_secrets.get_secret_contents('discord-bot-admin-user-id')
-            adminUser = interaction.guild.get_member(int(admin_user_id))
-            await adminUser.send(f'An error occured in petebot; command /translate_this; {e}')
-            await interaction.followup.send(f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True)    
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /translate_this; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)    
+
+
+
+    '''
+    /TRANSLATE_MULTI
+    Given input text and up to five target languages, reply with every translation in one message.
+    The source language is detected once and the languages are translated concurrently.
+    '''
+    @app_commands.command(name="translate_multi", description="Translate input text into several languages at once. Replies with every translation.")
+    @app_commands.describe(text="Text to translate")
+    @app_commands.choices(
+        target_language_1=multiLanguageChoices,
+        target_language_2=multiLanguageChoices,
+        target_language_3=multiLanguageChoices,
+        target_language_4=multiLanguageChoices,
+        target_language_5=multiLanguageChoices
+    )
+    async def translate_multi(
+        self,
+        interaction: discord.Interaction,
+        text: str,
+        target_language_1: app_commands.Choice[str],
+        target_language_2: app_commands.Choice[str] = None,
+        target_language_3: app_commands.Choice[str] = None,
+        target_language_4: app_commands.Choice[str] = None,
+        target_language_5: app_commands.Choice[str] = None
+    ):
+        logger.write_log(
+            action='/translate_multi',
+            payload=f'User {interaction.user.name} invoked the /translate_multi command',
+            severity='Debug'
+        )
+        # message can take longer than 3 second timeout. defer
+        await rest_scheduler.submit(interaction.guild_id, interaction.response.defer, priority=rest_scheduler.INTERACTION)
 
+        try:
+            # drop empty options and repeats, keep the order the user picked
+            targetLanguages = {}
+            for choice in [target_language_1, target_language_2, target_language_3, target_language_4, target_language_5]:
+                if choice:
+                    targetLanguages.setdefault(choice.value, choice.name)
+
+            translateDict = await gcp_translate.translate_multi(text, list(targetLanguages))
+            '''
+            Format:
+            [Detected Language]: [text]
+            [Language 1]: [translation]
+            [Language 2]: [translation]
+            '''
+            lines = [f"{translateDict['detectedSourceLanguage']}: {text}"]
+            for language, name in targetLanguages.items():
+                lines.append(f"{name}: {translateDict['translations'][language]}")
+            # five translations of a long text go over discord's 2000 character limit, send them as several followups
+            for response in gcp_translate.split_reply(lines):
+                await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, response, priority=rest_scheduler.INTERACTION)
+
+        except Exception as e:
+            logger.write_log(
+                action='/translate_multi',
+                payload=e,
+                severity='Error'
+            )
+            adminUser = interaction.guild.get_member(gcp_secrets.get_admin_user_id())
+            await rest_scheduler.submit(None, adminUser.send, f'An error occured in petebot; command /translate_multi; {e}', priority=rest_scheduler.BACKGROUND)
+            await rest_scheduler.submit(interaction.guild_id, interaction.followup.send, f"Hello <@{interaction.user.id}>. This command has failed. A notification has been sent to admin to investigate.", ephemeral=True, priority=rest_scheduler.INTERACTION)
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(Translate(bot))
\ No newline at end of file
+    await bot.add_cog(Translate(bot))
@@ -0,0 +1,74 @@
+import discord
+import hashlib
+import inspect
+import json
+import os
+
+# py files
+import firestore # used to talk to firestore
+import logger # used to write logs to google log explorer as well as to stdout
+
+'''
+Syncs the /command tree to discord only when it changed.
+A sha256 of the tree's payload is kept in firestore per environment. On startup the tree is hashed again
+and tree.sync() only runs if the hash is different, so restarts and reconnects don't spend the global sync rate limit.
+A failed sync (firestore or discord unreachable) is tried again the next time sync_commands is called.
+Set sync_guild_id to sync to a single server instead. Guild commands update instantly, useful while developing.
+'''
+
+env = os.getenv('env')
+syncGuildID = os.getenv('sync_guild_id') # optional, sync to this guild only
+synced = False # set once the tree is known to match discord, after that the process never syncs again
+
+
+def command_payload(tree, guild=None):
+    commands = []
+    for command in tree.get_commands(guild=guild):
+        # discord.py 2.4+ needs the tree for translations, older versions take no arguments
+        if 'tree' in inspect.signature(command.to_dict).parameters:
+            commands.append(command.to_dict(tree))
+        else:
+            commands.append(command.to_dict())
+    return commands
+
+
+def tree_hash(tree, guild=None):
+    commands = command_payload(tree, guild)
+    payload = json.dumps(commands, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest(), len(commands)
+
+
+async def sync_commands(tree):
+    '''
+    Sync tree to discord if its hash changed since the last sync. Returns True if a sync ran.
+    '''
+    global synced
+    if synced:
+        return False
+
+    guild = None
+    name = env
+    if syncGuildID:
+        guild = discord.Object(id=int(syncGuildID))
+        tree.copy_global_to(guild=guild) # guild commands show up immediately, global ones can take an hour
+        name = f'{env}-{syncGuildID}'
+
+    treeHash, commandCount = tree_hash(tree, guild)
+    if treeHash == await firestore.get_command_sync_hash(name):
+        logger.write_log(
+            action=None,
+            payload=f"Command tree unchanged ({commandCount} command(s)). Skipping sync.",
+            severity='Debug'
+        )
+        synced = True
+        return False
+
+    syncedCommands = await tree.sync(guild=guild)
+    synced = True # discord has the tree, a failure storing the hash only means the next process syncs again
+    await firestore.set_command_sync_hash(name, treeHash, len(syncedCommands))
+    logger.write_log(
+        action=None,
+        payload=f"synced {len(syncedCommands)} command(s){f' to guild {syncGuildID}' if guild else ''}",
+        severity='Info'
+    )
+    return True
@@ -1,25 +1,311 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+import asyncio
 import os
+import threading
+import time
 import logger
+import metrics # request counts and latencies
 
 env = os.getenv('env') # for logging
 
-# Always use the application default credentials
-# Default creds are inhereted on VM
-# Uses the credential.json on local docker
+# every read and write goes through the async client so a slow firestore call never blocks the discord event loop
+adb = None
+# on_snapshot listeners are only available on the sync client. they run on their own background threads
+db = None
+clientLock = threading.Lock()
 
-# Assign credential
-cred = credentials.ApplicationDefault()
+# a guild's original role message lives at servers/{guild}/features/roleSelect.
+# additional role messages live at servers/{guild}/features/roleSelect/roleMessages/{messageID}.
+# each config document has its own roles subcollection. "slot" names a config: PRIMARY or the additional message's id
+PRIMARY = u'roleSelect'
 
-# log into Firestore
-app = firebase_admin.initialize_app(cred)
-db = firestore.client()
+# in-memory copy of every role message config and its roles subcollection
+# format: {guildID: {slot: {'config': {...} or None, 'roles': {emote: {...}}}}}
+# kept current by firestore on_snapshot listeners so reaction events never wait on a firestore round trip
+roleCache = {}
+roleLoads = {} # guildID: task loading that guild, concurrent callers share it
 
-def set_role_message(guildID, messageID, channelID, title, description):
+# three collection group listeners keep every guild's documents current, not one listener per guild and role message
+groupWatches = []
+watchesStarted = None # future done once every listener has delivered its first snapshot
+ownsGuild = None # set by preload_guilds. listener changes for guilds on other processes' shards are dropped
+
+# routing index from every active role message to its config, {messageID: (guildID, slot)}
+# loaded once at startup so reaction listeners can drop reactions on any other message without any I/O
+roleMessageIndex = {}
+slotMessages = {} # reverse of roleMessageIndex, {(guildID, slot): messageID}
+
+maxBatchWrites = 500 # firestore limit on writes in one batch
+
+
+def init():
+    '''
+    Import firebase admin, log into firestore and create both clients.
+    Called on a startup thread alongside the other google backends. Safe to call from several threads, runs once.
+    '''
+    global adb, db
+    with clientLock:
+        if adb is None:
+            import firebase_admin
+            from firebase_admin import credentials
+            from firebase_admin import firestore
+            from firebase_admin import firestore_async
+
+            # Always use the application default credentials
+            # Default creds are inhereted on VM
+            # Uses the credential.json on local docker
+            firebase_admin.initialize_app(credentials.ApplicationDefault())
+            db = firestore.client()
+            adb = firestore_async.client()
+    return adb
+
+
+def async_client():
+    return adb or init()
+
+
+def sync_client():
+    if db is None:
+        init()
+    return db
+
+
+def role_select_ref(guildID, client=None):
+    client = client or async_client()
+    return client.collection(u'servers').document(str(guildID)).collection(u'features').document(PRIMARY)
+
+
+def role_config_ref(guildID, slot, client=None):
+    ref = role_select_ref(guildID, client)
+    if slot == PRIMARY:
+        return ref
+    return ref.collection(u'roleMessages').document(str(slot))
+
+
+def index_role_message(guildID, slot, config):
+    '''
+    Point the routing index at the message a slot currently uses. config=None removes the slot.
+    '''
+    key = (int(guildID), slot)
+    oldMessageID = slotMessages.pop(key, None)
+    if oldMessageID is not None:
+        roleMessageIndex.pop(oldMessageID, None)
+    if config:
+        slotMessages[key] = config['messageID']
+        roleMessageIndex[config['messageID']] = key
+
+
+def is_role_message(messageID):
+    return messageID in roleMessageIndex
+
+
+def route_role_message(messageID):
+    '''
+    Return (guildID, slot) for a role message, or None if messageID is not a role message
+    '''
+    return roleMessageIndex.get(messageID)
+
+
+async def collect(stream, operation=u'query'):
+    with metrics.timer('firestore_request_seconds', operation=operation):
+        return [doc async for doc in stream]
+
+
+async def preload_guilds(owns_guild=None):
+    '''
+    Warm roleCache, the routing index and autoTranslateCache for every guild, then keep them current.
+    Three collection group listeners cover every guild:
+    1. features: every roleSelect and autoTranslate document
+    2. roleMessages: every additional role message config
+    3. roles: every role of every role message
+    Their first snapshots hold every document and preload waits for them, later snapshots only carry the changes.
+    Called from setup_hook before the bot connects.
+    owns_guild(guildID) limits the cache to the guilds on this process's shards, the listeners drop changes for other guilds.
+    '''
+    global ownsGuild, preloaded
+    start = time.monotonic()
+    ownsGuild = owns_guild
+    with metrics.timer('firestore_request_seconds', operation=u'collection_group'):
+        await start_watches()
+
+    # every autoTranslate document is in autoTranslateCache now, a guild without one has no auto translate channels
+    preloaded = True
+
+    logger.write_log(
+        action=None,
+        payload=f"Preloaded {len(roleCache)} role guild(s) and {len(autoTranslateCache)} auto translate guild(s) in {time.monotonic() - start:.2f}s. "
+                f"{len(roleMessageIndex)} role message(s) indexed.",
+        severity='Info'
+    )
+
+
+def start_watches():
+    '''
+    Start the collection group listeners, once per process.
+    Returns a future that is done when all of them have delivered their first snapshot.
+    '''
+    global watchesStarted
+    if watchesStarted is None:
+        # listener callbacks run on a firestore background thread.
+        # each one hands its changes to the event loop so the caches and index only ever change there
+        loop = asyncio.get_event_loop()
+        firstSnapshots = []
+        for collectionID, parse in ((u'features', parse_feature), (u'roleMessages', parse_role_message), (u'roles', parse_role)):
+            firstSnapshot = loop.create_future()
+            firstSnapshots.append(firstSnapshot)
+            groupWatches.append(sync_client().collection_group(collectionID).on_snapshot(listener(loop, parse, firstSnapshot)))
+        watchesStarted = asyncio.gather(*firstSnapshots)
+        logger.write_log(
+            action=None,
+            payload=f"Started {len(groupWatches)} collection group listener(s).",
+            severity='Debug'
+        )
+    return watchesStarted
+
+
+def listener(loop, parse, firstSnapshot):
+    def on_snapshot(col_snapshot, changes, read_time):
+        updates = [parse(change.document, change.type.name == 'REMOVED') for change in changes]
+        loop.call_soon_threadsafe(apply_updates, [update for update in updates if update], firstSnapshot)
+    return on_snapshot
+
+
+# listener changes are parsed into updates on the listener thread:
+# ('config', guildID, slot, config or None), ('role', guildID, slot, emote, role or None), ('autoTranslate', guildID, channels)
+def parse_feature(doc, removed):
+    guildID = int(doc.reference.parent.parent.id)
+    if doc.id == PRIMARY:
+        return ('config', guildID, PRIMARY, None if removed else format_role_message(doc.to_dict()))
+    if doc.id == u'autoTranslate':
+        return ('autoTranslate', guildID, format_auto_translate(None if removed else doc.to_dict()))
+    return None
+
+
+def parse_role_message(doc, removed):
+    guildID = int(doc.reference.parent.parent.parent.parent.id)
+    return ('config', guildID, doc.id, None if removed else format_role_message(doc.to_dict()))
+
+
+def parse_role(doc, removed):
+    configRef = doc.reference.parent.parent
+    if configRef.parent.id == u'roleMessages':
+        guildID, slot = int(configRef.parent.parent.parent.parent.id), configRef.id
+    else:
+        guildID, slot = int(configRef.parent.parent.id), PRIMARY
+    return ('role', guildID, slot, doc.id, None if removed else doc.to_dict())
+
+
+def apply_updates(updates, firstSnapshot):
+    '''
+    Apply one listener snapshot to roleCache, the routing index and autoTranslateCache. Runs on the event loop.
+    '''
+    for update in updates:
+        kind, guildID = update[0], update[1]
+        if ownsGuild and not ownsGuild(guildID):
+            continue
+        if kind == 'autoTranslate':
+            autoTranslateCache[guildID] = update[2]
+        elif kind == 'config':
+            slot, config = update[2], update[3]
+            guildCache = roleCache.setdefault(guildID, {PRIMARY: {'config': None, 'roles': {}}})
+            if config is None and slot != PRIMARY:
+                guildCache.pop(slot, None) # an additional role message was removed
+            else:
+                guildCache.setdefault(slot, {'config': None, 'roles': {}})['config'] = config
+            index_role_message(guildID, slot, config)
+        else:
+            slot, emote, role = update[2], update[3], update[4]
+            if role is None:
+                # roles are deleted with their message, which may already be gone
+                roles = roleCache.get(guildID, {}).get(slot, {}).get('roles', {})
+                roles.pop(emote, None)
+            else:
+                # a new message's roles can arrive before its config
+                guildCache = roleCache.setdefault(guildID, {PRIMARY: {'config': None, 'roles': {}}})
+                guildCache.setdefault(slot, {'config': None, 'roles': {}})['roles'][emote] = role
+    if not firstSnapshot.done():
+        firstSnapshot.set_result(None)
+
+
+def format_role_message(doc_json):
+    # ids are strings in firestore, convert to int to match payload
+    return {
+        'messageID' : int(doc_json['messageID']),
+        'channelID' : int(doc_json['channelID']),
+        'messageTitle': doc_json['messageTitle'],
+        'messageDescription': doc_json['messageDescription']
+    }
+
+
+async def watch_guild(guildID):
+    '''
+    Return a guild's entry in roleCache, every role message config and its roles. The collection group listeners keep it current.
+    A guild missing from the cache is read from firestore once. Every call after that is a dictionary lookup.
+    '''
+    guildID = int(guildID)
+    if guildID in roleCache:
+        return roleCache[guildID]
+
+    # events that arrive while the guild is loading wait on the same load instead of starting their own
+    task = roleLoads.get(guildID)
+    if task is None:
+        task = roleLoads[guildID] = asyncio.ensure_future(load_guild(guildID))
+        task.add_done_callback(lambda _: roleLoads.pop(guildID, None))
+    return await asyncio.shield(task)
+
+
+async def load_slot_roles(guildID, slot):
+    roles = await collect(role_config_ref(guildID, slot).collection(u'roles').stream())
+    return {role.id: role.to_dict() for role in roles}
+
+
+async def load_guild(guildID):
+    start_watches() # normally started by preload_guilds, changes after this read reach the cache through them
+    with metrics.timer('firestore_request_seconds', operation=u'get'):
+        doc = await role_select_ref(guildID).get()
+    configs = {PRIMARY: format_role_message(doc.to_dict()) if doc.exists else None}
+    for doc in await collect(role_select_ref(guildID).collection(u'roleMessages').stream()):
+        configs[doc.id] = format_role_message(doc.to_dict())
+    slots = list(configs)
+    roles = await asyncio.gather(*[load_slot_roles(guildID, slot) for slot in slots])
+
+    if guildID in roleCache:
+        return roleCache[guildID] # filled in by a listener while this read was in flight, it's at least as new
+    guildCache = roleCache[guildID] = {}
+    for slot, slotRoles in zip(slots, roles):
+        guildCache[slot] = {'config': configs[slot], 'roles': slotRoles}
+        index_role_message(guildID, slot, configs[slot])
+    return guildCache
+
+
+def unwatch_guild(guildID):
+    '''
+    Drop a guild's role messages from the cache and the routing index. Used when the bot leaves a guild.
+    The listeners cover every guild so there is nothing to stop, if the bot is added back the guild is read again on first use.
+    '''
+    guildID = int(guildID)
+    roleCache.pop(guildID, None)
+    for key in [key for key in slotMessages if key[0] == guildID]:
+        index_role_message(guildID, key[1], None)
+
+
+async def get_slot(guildID, messageID=None):
+    '''
+    Return the slot holding a guild's role message. messageID=None is the guild's primary message.
+    Returns None if messageID is not a role message in this guild.
+    '''
+    if messageID is None:
+        return PRIMARY
+    await watch_guild(guildID)
+    route = roleMessageIndex.get(int(messageID))
+    if route and route[0] == int(guildID):
+        return route[1]
+    return None
+
+
+async def set_role_message(guildID, messageID, channelID, title, description, additional=False):
     '''
     Set the value for a messageID in firestore. Will also create the feature for roleSelect in a channel
+    additional=False replaces the guild's primary role message, additional=True adds another role message
     '''
     # otherwise add user to collection
     data = {
@@ -29,26 +315,56 @@ def set_role_message(guildID, messageID, channelID, title, description):
         u'messageTitle': title,
         u'messageDescription':description
     }
+    slot = str(messageID) if additional else PRIMARY
     # add the document
-    db.collection(u'servers').document(str(guildID)).collection(u'features').document(u'roleSelect').set(data)
+    with metrics.timer('firestore_request_seconds', operation=u'set'):
+        await role_config_ref(guildID, slot).set(data)
+    # write through so the next reaction sees the new message without waiting on the listener
+    guildCache = await watch_guild(guildID)
+    guildCache.setdefault(slot, {'config': None, 'roles': {}})['config'] = format_role_message(data)
+    index_role_message(guildID, slot, format_role_message(data))
+
+
+async def remove_role_message(guildID, messageID):
+    '''
+    Delete an additional role message and all of its roles
+    '''
+    slot = await get_slot(guildID, messageID)
+    if slot is None:
+        return f'Message {messageID} is not a role message in this server. Taking no action.'
+    if slot == PRIMARY:
+        return f'Message {messageID} is the main role message. Use /set_role_message to replace it.'
+
+    guildCache = await watch_guild(guildID)
+    roleCount = len(guildCache[slot]['roles'])
+    batch = async_client().batch()
+    for emote in guildCache[slot]['roles']:
+        batch.delete(role_config_ref(guildID, slot).collection(u'roles').document(emote))
+    batch.delete(role_config_ref(guildID, slot))
+    with metrics.timer('firestore_request_seconds', operation=u'batch'):
+        await batch.commit()
+    guildCache.pop(slot, None) # write through
+    index_role_message(guildID, slot, None)
+
+    user_response = f'Removed role message {messageID} and its {roleCount} role(s).'
+    logger.write_log(
+        action=None,
+        payload=user_response,
+        severity='Info'
+    )
+    return user_response
 
 
-def get_role_message(guildID):
+async def get_role_message(guildID, messageID=None):
     '''
     Look up document based on GuildID. Return the messageID saved for that server.
+    messageID selects one of the guild's additional role messages, None is the guild's primary message.
+    Served from roleCache, firestore is only read the first time a guild is seen.
     '''
-    doc_ref = db.collection(u'servers').document(str(guildID)).collection(u'features').document('roleSelect')
-    doc = doc_ref.get()
-
-    if doc.exists:
-        doc_json = doc.to_dict()
-        response = {
-            'messageID' : int(doc_json['messageID']),
-            'channelID' : int(doc_json['channelID']),
-            'messageTitle': doc_json['messageTitle'],
-            'messageDescription': doc_json['messageDescription']
-        }
-        return response # its a string in firestore, convert to int to match payload}
+    slot = await get_slot(guildID, messageID)
+    config = (await watch_guild(guildID)).get(slot, {}).get('config')
+    if config:
+        return config
     else:
         logger.write_log(
             action=None,
@@ -58,17 +374,26 @@ def get_role_message(guildID):
     return None # no collection found
 
 
-def get_role(guildID, payloadEmote):
+async def list_role_messages(guildID):
     '''
-    Return a role when given an emote
+    Return [(config, [roles])] for every role message in a guild, primary message first
     '''
-    doc_ref = db.collection(u'servers').document(str(guildID)).collection('features').document('roleSelect').collection(u'roles').document(payloadEmote)
-    doc = doc_ref.get()
+    guildCache = await watch_guild(guildID)
+    slots = sorted(guildCache, key=lambda slot: slot != PRIMARY)
+    return [(guildCache[slot]['config'], list(guildCache[slot]['roles'].values())) for slot in slots if guildCache[slot]['config']]
 
-    if doc.exists:
-        doc_json = doc.to_dict()
-        roleName = doc_json['roleName']
-        return roleName
+
+async def get_role(guildID, payloadEmote, messageID=None):
+    '''
+    Return the discord role id for an emote
+    messageID selects the role message the emote is on, None is the guild's primary message.
+    '''
+    slot = await get_slot(guildID, messageID)
+    role = (await watch_guild(guildID)).get(slot, {}).get('roles', {}).get(payloadEmote)
+
+    if role:
+        roleID = int(role['roleID'])
+        return roleID
     else:
         logger.write_log(
             action=None,
@@ -77,19 +402,22 @@ def get_role(guildID, payloadEmote):
         )
         return None
 
-def add_role(guildID, payloadEmote, roleName, roleID):
+async def add_role(guildID, payloadEmote, roleName, roleID, messageID=None):
     '''
     if role collection doesn't exist, it will be created
     if a document for the emote already exists, it will be overwritten
+    messageID selects the role message to add to, None is the guild's primary message.
     '''
     # check if the emote already exists
-    doc_ref = db.collection(u'servers').document(str(guildID)).collection(u'features').document('roleSelect').collection(u'roles').document(payloadEmote)
-    doc = doc_ref.get()
+    slot = await get_slot(guildID, messageID)
+    if slot is None:
+        return f'Message {messageID} is not a role message in this server. Taking no action.'
+    slotCache = (await watch_guild(guildID)).setdefault(slot, {'config': None, 'roles': {}})
+    existing = slotCache['roles'].get(payloadEmote)
     exists = False
 
-    if doc.exists:
-        doc_json = doc.to_dict()
-        oldRoleName = doc_json['roleName']
+    if existing:
+        oldRoleName = existing['roleName']
         logger.write_log(
             action=None,
             payload=f"A role has already been created for #{oldRoleName} using emote {payloadEmote}.",
@@ -104,7 +432,9 @@ def add_role(guildID, payloadEmote, roleName, roleID):
         u'roleID': str(roleID)
     }
     # add the document
-    db.collection(u'servers').document(str(guildID)).collection(u'features').document('roleSelect').collection(u'roles').document(payloadEmote).set(data)
+    with metrics.timer('firestore_request_seconds', operation=u'set'):
+        await role_config_ref(guildID, slot).collection(u'roles').document(payloadEmote).set(data)
+    slotCache['roles'] = {**slotCache['roles'], payloadEmote: data} # write through
     user_response = ''
 
     if exists == True:
@@ -120,23 +450,67 @@ def add_role(guildID, payloadEmote, roleName, roleID):
     return user_response
 
 
-def remove_role(guildID, payloadEmote):
+async def add_roles(guildID, roles, messageID=None):
+    '''
+    Add many emote/role pairs at once. roles is a list of (emote, roleName, roleID).
+    Existing emotes are overwritten. Written with batched writes instead of one request per role.
+    Returns (created, updated) counts, or an error string if messageID is not a role message.
+    '''
+    slot = await get_slot(guildID, messageID)
+    if slot is None:
+        return f'Message {messageID} is not a role message in this server. Taking no action.'
+    slotCache = (await watch_guild(guildID)).setdefault(slot, {'config': None, 'roles': {}})
+    rolesRef = role_config_ref(guildID, slot).collection(u'roles')
+    newRoles = dict(slotCache['roles'])
+    updated = 0
+
+    # firestore allows at most 500 writes in one batch
+    for start in range(0, len(roles), maxBatchWrites):
+        batch = async_client().batch()
+        for payloadEmote, roleName, roleID in roles[start:start + maxBatchWrites]:
+            data = {
+                u'roleName': roleName,
+                u'roleEmote': payloadEmote,
+                u'roleID': str(roleID)
+            }
+            batch.set(rolesRef.document(payloadEmote), data)
+            if payloadEmote in slotCache['roles']:
+                updated += 1
+            newRoles[payloadEmote] = data
+        with metrics.timer('firestore_request_seconds', operation=u'batch'):
+            await batch.commit()
+    slotCache['roles'] = newRoles # write through
+
+    logger.write_log(
+        action=None,
+        payload=f'Imported {len(roles)} role(s) for guild {guildID}. {len(roles) - updated} new, {updated} updated.',
+        severity='Info'
+    )
+    return len(roles) - updated, updated
+
+
+async def remove_role(guildID, payloadEmote, messageID=None):
     '''
     Check if an emote/role name pair exists
     If it does not exist, notify the user
     If it exists, remove it
+    messageID selects the role message to remove from, None is the guild's primary message.
     '''
 
     # check if the emote already exists
-    doc_ref = db.collection(u'servers').document(str(guildID)).collection('features').document('roleSelect').collection(u'roles').document(payloadEmote)
-    doc = doc_ref.get()
+    slot = await get_slot(guildID, messageID)
+    if slot is None:
+        return f'Message {messageID} is not a role message in this server. Taking no action.'
+    slotCache = (await watch_guild(guildID)).get(slot, {'config': None, 'roles': {}})
+    existing = slotCache['roles'].get(payloadEmote)
     exists = False
     user_response = ''
-    if doc.exists:
-        doc_json = doc.to_dict()
-        RoleName = doc_json['roleName']
+    if existing:
+        RoleName = existing['roleName']
         # delete an emote:roleName to roles collection
-        doc_ref.delete()
+        with metrics.timer('firestore_request_seconds', operation=u'delete'):
+            await role_config_ref(guildID, slot).collection(u'roles').document(payloadEmote).delete()
+        slotCache['roles'] = {emote: role for emote, role in slotCache['roles'].items() if emote != payloadEmote} # write through
         user_response = f'Removed rule for the emote {payloadEmote} and role #{RoleName}.'
         logger.write_log(
             action=None,
@@ -153,13 +527,117 @@ def remove_role(guildID, payloadEmote):
     return user_response
 
 
-def show_roles(guildID):
+async def show_roles(guildID, messageID=None):
     '''
     Return a list of roles to a user
+    messageID selects the role message, None is the guild's primary message.
     '''
-    # stream used to retrieve multiple docs
-    docs = db.collection(u'servers').document(str(guildID)).collection(u'features').document('roleSelect').collection(u'roles').stream()
-    doc_list = []
-    for doc in docs:
-        doc_list.append(doc.to_dict())
-    return doc_list
+    slot = await get_slot(guildID, messageID)
+    return list((await watch_guild(guildID)).get(slot, {}).get('roles', {}).values())
+
+
+# channels that translate every message, {guildID: {channelID: [language codes]}}
+# kept current by the features collection group listener, on_message reads it for every message
+autoTranslateCache = {}
+autoTranslateLoads = {} # guildID: task loading that guild
+preloaded = False # set by preload_guilds, after that a guild missing from autoTranslateCache has no autoTranslate document
+
+
+def auto_translate_ref(guildID, client=None):
+    client = client or async_client()
+    return client.collection(u'servers').document(str(guildID)).collection(u'features').document(u'autoTranslate')
+
+
+def format_auto_translate(doc_json):
+    # channel ids are map keys so they are strings in firestore
+    return {int(channelID): list(languages) for channelID, languages in (doc_json or {}).get('channels', {}).items()}
+
+
+async def get_auto_translate_channels(guildID):
+    '''
+    Return {channelID: [language codes]} for every auto translate channel in a guild.
+    Most guilds have no autoTranslate document and after preload_guilds they cost a dictionary lookup, no firestore read.
+    '''
+    guildID = int(guildID)
+    if guildID in autoTranslateCache:
+        return autoTranslateCache[guildID]
+    if preloaded:
+        return {}
+
+    task = autoTranslateLoads.get(guildID)
+    if task is None:
+        task = autoTranslateLoads[guildID] = asyncio.ensure_future(load_auto_translate(guildID))
+        task.add_done_callback(lambda _: autoTranslateLoads.pop(guildID, None))
+    return await asyncio.shield(task)
+
+
+async def load_auto_translate(guildID):
+    # only reached when preload_guilds didn't run. the guild is read once, even without a document
+    start_watches()
+    with metrics.timer('firestore_request_seconds', operation=u'get'):
+        doc = await auto_translate_ref(guildID).get()
+    return autoTranslateCache.setdefault(guildID, format_auto_translate(doc.to_dict() if doc.exists else None))
+
+
+async def set_auto_translate_channel(guildID, channelID, languages):
+    '''
+    Translate every message in a channel into languages. Replaces the languages if the channel is already set.
+    '''
+    with metrics.timer('firestore_request_seconds', operation=u'set'):
+        await auto_translate_ref(guildID).set({
+            u'enabled': 'true',
+            u'channels': {str(channelID): languages}
+        }, merge=True)
+    channels = await get_auto_translate_channels(guildID)
+    autoTranslateCache[int(guildID)] = {**channels, int(channelID): list(languages)} # write through
+    user_response = f'Messages in <#{channelID}> will be translated to {", ".join(languages)}.'
+    logger.write_log(
+        action=None,
+        payload=user_response,
+        severity='Info'
+    )
+    return user_response
+
+
+async def remove_auto_translate_channel(guildID, channelID):
+    channels = await get_auto_translate_channels(guildID)
+    if int(channelID) not in channels:
+        return f'<#{channelID}> is not an auto translate channel. Taking no action.'
+
+    from firebase_admin import firestore # already imported by init()
+    with metrics.timer('firestore_request_seconds', operation=u'update'):
+        await auto_translate_ref(guildID).update({
+            firestore.FieldPath(u'channels', str(channelID)).to_api_repr(): firestore.DELETE_FIELD
+        })
+    autoTranslateCache[int(guildID)] = {channel: languages for channel, languages in channels.items() if channel != int(channelID)} # write through
+    user_response = f'Messages in <#{channelID}> will no longer be translated.'
+    logger.write_log(
+        action=None,
+        payload=user_response,
+        severity='Info'
+    )
+    return user_response
+
+
+def command_sync_ref(name):
+    # bot wide settings that don't belong to a server, one document per environment
+    return async_client().collection(u'botConfig').document(f'commandSync-{name}')
+
+
+async def get_command_sync_hash(name):
+    '''
+    Return the hash of the command tree last synced to discord, or None if it was never synced
+    '''
+    with metrics.timer('firestore_request_seconds', operation=u'get'):
+        doc = await command_sync_ref(name).get()
+    return doc.to_dict().get('hash') if doc.exists else None
+
+
+async def set_command_sync_hash(name, treeHash, commandCount):
+    from firebase_admin import firestore # already imported by init()
+    with metrics.timer('firestore_request_seconds', operation=u'set'):
+        await command_sync_ref(name).set({
+            u'hash': treeHash,
+            u'commandCount': commandCount,
+            u'syncedAt': firestore.SERVER_TIMESTAMP
+        })
@@ -0,0 +1,79 @@
+import json
+import os
+import re
+import time
+
+'''
+Format shared by the gateway recorder cog and bench/replay.py.
+One JSON object per line: {"ts": unix time, "t": event type, "d": the fields of the event the bot uses}.
+Only reaction and interaction dispatches are kept, and only the ids and names needed to replay them,
+so a recording of a busy guild stays small and holds no message content.
+Command options are free text (/translate text, role message titles and descriptions...) unless the value is one of
+the command's choices, an emoji or a snowflake id (message_id...). Free text is replaced with a placeholder of the same length, so a replay sends
+the same amount of text without recording what anyone wrote.
+'''
+
+recordPath = os.getenv('gateway_record_path') # recording is off unless this is set
+recordedEvents = ('MESSAGE_REACTION_ADD', 'MESSAGE_REACTION_REMOVE', 'INTERACTION_CREATE')
+recordedPattern = re.compile(r'"t"\s*:\s*"(?:MESSAGE_REACTION_|INTERACTION_CREATE")')
+customEmoji = re.compile(r'<a?:\w+:\d+>')
+snowflake = re.compile(r'\d{15,20}') # discord ids, replays route commands like /add_role message_id with them
+choiceValues = set() # values of every option choice in the command tree, filled by the recorder cog
+
+
+def might_record(msg):
+    # cheap check on the raw text so most dispatches are never parsed twice. the spacing of the json isn't fixed
+    return recordedPattern.search(msg) is not None
+
+
+def option_value(value):
+    '''
+    Keep choices, emoji, ids, numbers and booleans. Replace any other text with a placeholder of the same length
+    '''
+    if not isinstance(value, str) or value in choiceValues or customEmoji.fullmatch(value) or snowflake.fullmatch(value.strip()):
+        return value
+    if len(value) <= 32 and not any(char.isalnum() for char in value):
+        return value # unicode emoji
+    return 'x' * len(value)
+
+
+def compact(eventType, data):
+    if eventType == 'INTERACTION_CREATE':
+        user = (data.get('member') or {}).get('user') or data.get('user') or {}
+        commandData = data.get('data') or {}
+        return {
+            'id': data.get('id'),
+            'type': data.get('type'),
+            'guild_id': data.get('guild_id'),
+            'channel_id': data.get('channel_id'),
+            'user_id': user.get('id'),
+            'name': commandData.get('name'),
+            'options': [{'name': option['name'], 'type': option['type'], 'value': option_value(option.get('value'))} for option in commandData.get('options', [])]
+        }
+    emoji = data.get('emoji') or {}
+    return {
+        'guild_id': data.get('guild_id'),
+        'channel_id': data.get('channel_id'),
+        'message_id': data.get('message_id'),
+        'user_id': data.get('user_id'),
+        'emoji': {'id': emoji.get('id'), 'name': emoji.get('name'), 'animated': emoji.get('animated', False)}
+    }
+
+
+def record_line(msg):
+    '''
+    Return the recording line for a raw gateway message, or None if it isn't recorded
+    '''
+    if not might_record(msg):
+        return None
+    event = json.loads(msg)
+    if event.get('op') != 0 or event.get('t') not in recordedEvents:
+        return None
+    return json.dumps({'ts': round(time.time(), 3), 't': event['t'], 'd': compact(event['t'], event['d'])}, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def emoji_text(emoji):
+    # same text str(payload.emoji) gives the listeners
+    if emoji.get('id'):
+        return f"<{'a' if emoji.get('animated') else ''}:{emoji['name']}:{emoji['id']}>"
+    return emoji['name']
@@ -1,22 +1,111 @@
-# Import the Secret Manager client library.
-from google.cloud import secretmanager
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import logger # used to write logs to google log explorer as well as to stdout
+import metrics # request counts and latencies
 
-def get_secret_contents(secretName):
-    # GCP project in which to store secrets in Secret Manager.
-    project_id = "885066695413"
+'''
+Secrets are read from memory.
+One Secret Manager client is shared for the life of the process, prefetch() loads every known secret
+in parallel at startup, and a background thread re-reads each secret after secret_ttl seconds.
+Callers only wait on the network the first time a secret that wasn't prefetched is used.
+'''
+
+# GCP project in which to store secrets in Secret Manager.
+project_id = "885066695413"
+
+ttl = float(os.getenv('secret_ttl', '3600')) # seconds before a secret is re-read in the background
+
+# secrets used by the bot, loaded by prefetch()
+env = os.getenv('env')
+tokenSecretName = 'discord-role-bot-token-dev' if env == 'dev' else 'discord-role-bot-token'
+knownSecrets = [
+    tokenSecretName,
+    'discord-bot-admin-user-id'
+]
+
+client = None # created on first use and reused
+clientLock = threading.Lock()
+secrets = {} # format: {secretName: (fetched at, payload)}
+refresher = None
 
-    # Create the Secret Manager client.
-    client = secretmanager.SecretManagerServiceClient()
 
+def get_client():
+    global client
+    with clientLock:
+        if client is None:
+            # Import the Secret Manager client library on first use and create the client.
+            from google.cloud import secretmanager
+            client = secretmanager.SecretManagerServiceClient()
+    return client
+
+
+def fetch_secret(secretName):
     # Build the parent name from the project.
     resource_name = f"projects/{project_id}/secrets/{secretName}/versions/latest"
 
     # Access the secret version.
-    response = client.access_secret_version(request={"name": resource_name})
+    with metrics.timer('secret_manager_request_seconds', operation='access'):
+        response = get_client().access_secret_version(request={"name": resource_name})
 
-    # Print the secret payload.
-    #
-    # WARNING: Do not print the secret in a production environment - this
-    # snippet is showing how to access the secret material.
+    # WARNING: Do not print the secret in a production environment
     payload = response.payload.data.decode("UTF-8")
-    return payload
\ No newline at end of file
+    secrets[secretName] = (time.monotonic(), payload)
+    return payload
+
+
+def get_secret_contents(secretName):
+    cached = secrets.get(secretName)
+    if cached:
+        return cached[1]
+    return fetch_secret(secretName)
+
+
+def get_admin_user_id():
+    return int(get_secret_contents('discord-bot-admin-user-id'))
+
+
+def get_bot_token():
+    return get_secret_contents(tokenSecretName)
+
+
+def prefetch(secretNames=None):
+    '''
+    Load every secret in parallel, then start the background refresh.
+    Returns the secret names that failed to load. They will be fetched on first use instead.
+    '''
+    secretNames = secretNames or knownSecrets
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(secretNames)) as executor:
+        futures = {secretName: executor.submit(fetch_secret, secretName) for secretName in secretNames}
+    for secretName, future in futures.items():
+        if future.exception():
+            failed.append(secretName)
+    start_refresh()
+    return failed
+
+
+def refresh_loop():
+    while True:
+        time.sleep(min(ttl, 60))
+        now = time.monotonic()
+        for secretName, (fetched, payload) in list(secrets.items()):
+            if now - fetched < ttl:
+                continue
+            try:
+                fetch_secret(secretName)
+            except Exception as e:
+                # keep serving the old value, try again next pass
+                logger.write_log(
+                    action=None,
+                    payload=f'Failed to refresh secret {secretName}. Error: {e}',
+                    severity='Warning'
+                )
+
+
+def start_refresh():
+    global refresher
+    if refresher is None:
+        refresher = threading.Thread(target=refresh_loop, name='secret-refresh', daemon=True)
+        refresher.start()
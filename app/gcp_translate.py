@@ -1,4 +1,25 @@
-from google.cloud import translate_v2 as translate
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+
+# py files
+import translate_cache # memoized translation results
+import language_id # offline language detection
+import metrics # request counts and latencies
+
+'''
+One long lived translate client is shared by every request. Its HTTP session keeps a pool of
+connections open so requests skip auth and connection setup.
+The translate library is blocking, so requests run on a bounded thread pool. That keeps the event loop free,
+lets many /translate calls overlap their network time and caps in flight requests at translate_concurrency.
+The google libraries are imported when the client is created, not when this module is imported.
+'''
+
+maxConcurrency = int(os.getenv('translate_concurrency', '8'))
+executor = ThreadPoolExecutor(max_workers=maxConcurrency, thread_name_prefix='translate')
+translate_client = None # created on first use
+clientLock = threading.Lock()
 
 languageDict = {
     "af": "Afrikaans",
@@ -137,14 +158,192 @@ languageDict = {
     "zu": "Zulu"
 }
 
-# translate text from detect language to target
-def translate_text(text, target):
-    translate_client = translate.Client()
+def get_client():
+    global translate_client
+    with clientLock:
+        if translate_client is None:
+            from google.cloud import translate_v2 as translate
+            from google.auth.transport.requests import AuthorizedSession
+            import google.auth
+            from requests.adapters import HTTPAdapter
+            credentials, _ = google.auth.default(scopes=translate.Client.SCOPE)
+            session = AuthorizedSession(credentials)
+            # one pooled connection per worker thread
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=maxConcurrency))
+            translate_client = translate.Client(credentials=credentials, _http=session)
+    return translate_client
+
+
+def language_name(code):
+    # the API can return codes that aren't in languageDict (zh-CN, iw...), show the code rather than fail
+    return languageDict.get(code, code)
+
+
+def split_reply(lines, limit=2000):
+    '''
+    Join lines into as few discord messages as possible, each at most limit characters (discord's limit is 2000).
+    Lines are kept whole unless one line alone is over the limit.
+    '''
+    messages = []
+    current = ''
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                messages.append(current)
+                current = ''
+            messages.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) <= limit:
+            current += '\n' + line
+        else:
+            if current:
+                messages.append(current)
+            current = line
+    if current:
+        messages.append(current)
+    return messages
+
+
+def request_translation(text, target, source=None):
+    '''
+    Blocking call to the translate API. Runs on the translate thread pool.
+    source: ISO639 code of the text if already known. Skips detection on the API side
+    '''
+    # the sqlite cache is read here rather than on the event loop
+    cached = translate_cache.load(text, target)
+    if cached:
+        return {**cached, 'input': text}
+
     # example response: {'translatedText': 'おはようございます、私の名前はXです。', 'detectedSourceLanguage': 'en', 'input': 'Good Morning, My Name is X.'}
-    response = translate_client.translate(text, target_language=target, format_='text')
-    return {
-        'detectedSourceLanguage': languageDict[response['detectedSourceLanguage']],
-        'detectedSourceLanguageISO639': response['detectedSourceLanguage'],
+    with metrics.timer('translate_request_seconds', operation='translate'):
+        response = get_client().translate(text, target_language=target, source_language=source, format_='text')
+    detected = response.get('detectedSourceLanguage', source)
+    result = {
+        'detectedSourceLanguage': language_name(detected),
+        'detectedSourceLanguageISO639': detected,
         'translatedText': response['translatedText'],
         'input': response['input']
-    }
\ No newline at end of file
+    }
+    translate_cache.put(text, target, result)
+    return result
+
+
+def request_detection(text):
+    # example response: {'language': 'en', 'confidence': 0.98, 'input': 'Good Morning'}
+    with metrics.timer('translate_request_seconds', operation='detect'):
+        return get_client().detect_language(text)['language']
+
+
+# translate text from detect language to target
+async def translate_text(text, target, source=None):
+    # repeated phrases are served from the cache instead of the API
+    cached = translate_cache.get(text, target)
+    if cached:
+        return {**cached, 'input': text}
+
+    # text that is already in the target language is echoed back without calling the API
+    if not source:
+        language, confidence = language_id.detect(text)
+        if language == target and confidence >= language_id.skipConfidence:
+            language_id.avoided += 1
+            return {
+                'detectedSourceLanguage': language_name(language),
+                'detectedSourceLanguageISO639': language,
+                'translatedText': text,
+                'input': text
+            }
+        if language and confidence >= language_id.hintConfidence:
+            language_id.hinted += 1
+            source = language
+    return await asyncio.get_event_loop().run_in_executor(executor, request_translation, text, target, source)
+
+
+async def translate_multi(text, targets):
+    '''
+    Translate text into several languages at once.
+    The source language is detected once, then every target is requested concurrently with that source,
+    so N languages cost about one round trip of latency.
+    Returns {'detectedSourceLanguage', 'detectedSourceLanguageISO639', 'translations': {target: translatedText}}
+    '''
+    results = {target: translate_cache.get(text, target) for target in targets}
+    missing = [target for target, result in results.items() if not result]
+
+    cachedResult = next((result for result in results.values() if result), None)
+    language, confidence = language_id.detect(text)
+    if cachedResult:
+        source = cachedResult['detectedSourceLanguageISO639']
+    elif language and confidence >= language_id.hintConfidence:
+        language_id.hinted += 1
+        source = language # detected locally, no detection round trip
+    else:
+        source = await asyncio.get_event_loop().run_in_executor(executor, request_detection, text)
+
+    # targets already in the source language don't need the API
+    for target in [target for target in missing if target == source]:
+        language_id.avoided += 1
+        results[target] = {'translatedText': text}
+        missing.remove(target)
+
+    # missing targets were just looked up in the cache, go straight to the translate threads so the miss isn't counted twice
+    loop = asyncio.get_event_loop()
+    translated = await asyncio.gather(*[loop.run_in_executor(executor, request_translation, text, target, source) for target in missing])
+    results.update(zip(missing, translated))
+    return {
+        'detectedSourceLanguage': language_name(source),
+        'detectedSourceLanguageISO639': source,
+        'translations': {target: result['translatedText'] for target, result in results.items()}
+    }
+
+
+def request_batch_translation(texts, target):
+    '''
+    Blocking call to the translate API with several strings in one request. Runs on the translate thread pool.
+    Strings found in the sqlite cache are left out of the request.
+    '''
+    results = [translate_cache.load(text, target) for text in texts]
+    results = [{**result, 'input': text} if result else None for text, result in zip(texts, results)]
+    missing = [i for i, result in enumerate(results) if not result]
+    if not missing:
+        return results
+    with metrics.timer('translate_request_seconds', operation='batch_translate'):
+        responses = get_client().translate([texts[i] for i in missing], target_language=target, format_='text')
+    for i, response in zip(missing, responses):
+        text = texts[i]
+        detected = response.get('detectedSourceLanguage')
+        result = {
+            'detectedSourceLanguage': language_name(detected),
+            'detectedSourceLanguageISO639': detected,
+            'translatedText': response['translatedText'],
+            'input': text
+        }
+        translate_cache.put(text, target, result)
+        results[i] = result
+    return results
+
+
+async def translate_batch(texts, target):
+    '''
+    Translate many strings into one language with a single API request.
+    Cached strings and strings already in the target language are left out of the request.
+    Returns one result per text, in order.
+    '''
+    results = [translate_cache.get(text, target) for text in texts]
+    for i, text in enumerate(texts):
+        if results[i]:
+            continue
+        language, confidence = language_id.detect(text)
+        if language == target and confidence >= language_id.skipConfidence:
+            language_id.avoided += 1
+            results[i] = {
+                'detectedSourceLanguage': language_name(language),
+                'detectedSourceLanguageISO639': language,
+                'translatedText': text,
+                'input': text
+            }
+
+    missing = [i for i, result in enumerate(results) if not result]
+    if missing:
+        translated = await asyncio.get_event_loop().run_in_executor(executor, request_batch_translation, [texts[i] for i in missing], target)
+        for i, result in zip(missing, translated):
+            results[i] = result
+    return results
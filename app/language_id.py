@@ -0,0 +1,185 @@
+import collections
+import math
+import os
+import unicodedata
+
+'''
+Offline language identification, used to skip translate API calls that would be a no-op.
+Two passes:
+1. script. Text written mostly in a script only one language uses (Hangul, Kana, Greek, Hebrew, Thai...)
+   is identified straight from the characters. Cyrillic and Arabic are narrowed down by letters unique to a language.
+2. character trigrams. Latin text is compared against trigram profiles built from the most common words of each language.
+detect() returns (language, confidence) where confidence is between 0 and 1, or (None, 0) when it can't tell.
+A language without a profile or unique letters still comes back as its nearest neighbour, so anything short of a clear
+match gets a confidence well below the skip and hint thresholds.
+'''
+
+minLetters = int(os.getenv('local_detect_min_letters', '12')) # shorter text is too ambiguous to call
+hintConfidence = float(os.getenv('local_detect_hint', '0.9')) # pass the local guess to the API as the source language
+# skip the API when the text is already in the target language. a wrong skip sends back untranslated text,
+# a wrong hint only costs translation quality, so skipping is never allowed below the hint threshold
+skipConfidence = max(float(os.getenv('local_detect_skip', '0.95')), hintConfidence)
+
+# script name (first word of the unicode character name) -> language, for scripts used by a single language
+uniqueScripts = {
+    'HANGUL': 'ko',
+    'HIRAGANA': 'ja',
+    'KATAKANA': 'ja',
+    'GREEK': 'el',
+    'HEBREW': 'iw',
+    'THAI': 'th',
+    'GEORGIAN': 'ka',
+    'ARMENIAN': 'hy',
+    'BENGALI': 'bn',
+    'TAMIL': 'ta',
+    'TELUGU': 'te',
+    'GUJARATI': 'gu',
+    'KANNADA': 'kn',
+    'MALAYALAM': 'ml',
+    'KHMER': 'km',
+    'LAO': 'lo',
+    'SINHALA': 'si'
+}
+
+# letters that only one language using the script has. letters shared with any other language are left out
+# (ъ is also bulgarian, ы э ё also belarusian, mongolian, kazakh..., і also belarusian, џ also macedonian, ў also uzbek)
+cyrillicMarkers = {
+    'uk': set('їєґ'),
+    'sr': set('ђћ'),
+    'mk': set('ѓќѕ')
+}
+# every letter of the slavic cyrillic alphabets. any other cyrillic letter (ө ү қ ә...) is a language we have no markers for
+slavicCyrillic = set('абвгдеёжзийклмнопрстуфхцчшщъыьэюяіїєґўђћџјљњѓќѕ')
+arabicMarkers = {
+    'fa': set('پچژگ'),
+    'ur': set('ٹڈڑںے')
+}
+
+# the most common words of each language. trigram profiles are built from these at import
+seedText = {
+    'en': 'the of and to in is you that it he was for on are as with his they at be this have from or one had by word but not what all were we when your can said there use an each which she do how their if will up other about out many then them these so some her would make like him into time has look two more write go see number no way could people my than first been call who its now find long down day did get come made may part hello good morning thanks please',
+    'de': 'der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an werden aus er hat dass sie nach wird bei einer um am sind noch wie einem über einen so zum war haben nur oder aber vor zur bis mehr durch man sein wurde sei hallo guten morgen danke bitte ich du wir ihr',
+    'es': 'el la de que y a en un ser se no haber por con su para como estar tener le lo todo pero más hacer o poder decir este ir otro ese si me ya ver porque dar cuando él muy sin vez mucho saber qué sobre mi alguno mismo yo también hasta año dos querer entre así hola buenos días gracias por favor',
+    'fr': 'le de un être et à il avoir ne je son que se qui ce dans en du elle au pour pas que vous par sur faire plus dire me on mon lui nous comme mais pouvoir avec tout y aller voir en bien où sans tu ou leur homme si deux mari moi vouloir te femme venir quand grand celui bonjour merci oui',
+    'it': 'il di che e la a per un in è non una sono mi si ho lo ma ha le con ti cosa se io come da ci questo qui bene hai sei del tu gli mio solo più della anche al perché me c\'è ora lei nel tutto era fatto niente molto ciao buongiorno grazie prego',
+    'pt': 'o de a que e do da em um para é com não uma os no se na por mais as dos como mas foi ao ele das tem à seu sua ou ser quando muito há nos já está eu também só pelo pela até isso ela entre era depois sem mesmo aos ter seus quem olá bom dia obrigado você',
+    'ro': 'și în de la a pe cu că nu o un se care este mai din pentru ce au fi am sunt el ea ei dar lui fost sau când acest această poate și foarte bine are după toate prin doar între acum bună ziua mulțumesc vă rog eu tu noi voi',
+    'tr': 've bir bu da de için ne ile çok daha ben sen o var gibi olarak kadar sonra ama en her diye olan mi değil nasıl ya biz siz onlar şey iyi yok zaman merhaba günaydın teşekkür ederim lütfen evet hayır şimdi burada',
+    'fi': 'ja on ei se että hän oli ovat mutta kun niin myös tai mitä minä sinä me te he tämä joka kuin jos vain sitten nyt jo kaikki olla ole hyvää huomenta kiitos moi hei ole hyvä missä miten koska',
+    'sv': 'och i att det som en på är av för med till den har de inte om ett han men var jag sig från vi så kan man när år säga hon nu ska också efter eller hej god morgon tack snälla du ni mycket bra här',
+    'pl': 'i w nie na się z że to do jest jak co tak ale o po od za jego go już jej był czy przez dla mnie jestem ty my wy oni tylko bardzo może cześć dzień dobry dziękuję proszę tak nie gdzie kiedy',
+    'lt': 'ir yra kad su į ne tai aš tu jis ji mes jūs jie buvo bet kaip kur kai dar labai gerai ačiū prašau labas rytas taip jau nuo iki per apie savo būti turi mano tavo',
+    'sl': 'in je v da se na za ne so z to pa bi jaz ti on ona mi vi oni kot tudi samo še ali kaj kje kdaj zelo dobro hvala prosim dober dan jutro lahko bil',
+    'hr': 'i je u da se na za ne su s to ja ti on ona mi vi oni kao samo još ili što gdje kada vrlo dobro hvala molim dobar dan jutro može bio sam smo ste ovo kako',
+    'da': 'og i at det er en til på de med for som den har af ikke han var jeg sig et men om vi fra så kan man når år sige hun nu skal også efter eller hej god morgen tak venligst du i meget godt her hvad hvor jer',
+    'no': 'og i det som på er en til å av for med har de ikke om et han men var jeg seg fra vi så kan man når år si hun nå skal også etter eller hei god morgen takk vær så snill du dere mye bra her hva hvor',
+    'gl': 'o a de que e en un unha ser se non haber por con seu para como estar ter lle lo todo pero máis facer ou poder dicir este ir outro ese se me xa ver porque dar cando el moi sen vez moito saber que sobre meu algún mesmo eu tamén ata ano dous querer entre así ola bos días grazas por favor',
+    'cs': 'a je v se na že to s z do jsem jako by ale o pro jsou tak si jeho co jak už jen ve k za být když mě ty my vy oni velmi může ahoj dobrý den děkuji prosím ano ne kde kdy tady byl',
+    'sk': 'a je v sa na že to s z do som ako by ale o pre sú tak si jeho čo ako už len vo k za byť keď ma ty my vy oni veľmi môže ahoj dobrý deň ďakujem prosím áno nie kde kedy tu bol',
+    'nl': 'de en van ik te dat die in een hij het niet zijn is was op aan met als voor had er maar om hem dan zou of wat mijn men dit zo door over ze zich bij ook tot je mij uit der daar haar naar heb hoe heeft hallo goedemorgen dank je wel alsjeblieft'
+}
+# languages too close to tell apart from trigrams. a match is never confident enough to skip the API
+closeLanguages = {'hr', 'sl'}
+# cosine score against a profile that real text in that language reaches. a weaker best match is only the least bad profile
+matchScore = 0.3
+
+
+def trigrams(text):
+    counts = collections.Counter()
+    for word in text.lower().split():
+        word = f' {word} '
+        for i in range(len(word) - 2):
+            counts[word[i:i + 3]] += 1
+    return counts
+
+
+def build_profile(text):
+    counts = trigrams(text)
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    return {gram: count / norm for gram, count in counts.items()}
+
+
+profiles = {language: build_profile(text) for language, text in seedText.items()}
+
+# stats
+checked = 0
+avoided = 0 # translate calls skipped because the text was already in the target language
+hinted = 0 # translate calls given a local source language instead of detecting on the API side
+
+
+def script_of(char):
+    try:
+        return unicodedata.name(char).split(' ')[0]
+    except ValueError:
+        return None
+
+
+def detect(text):
+    '''
+    Return (language ISO639 code, confidence 0-1). (None, 0) if the text is too short or unknown.
+    '''
+    global checked
+    checked += 1
+    letters = [char for char in text if char.isalpha()]
+    if len(letters) < minLetters:
+        return None, 0.0
+
+    scripts = collections.Counter(script_of(char) for char in letters)
+    script, count = scripts.most_common(1)[0]
+    share = count / len(letters)
+
+    if script in ('CJK', 'HIRAGANA', 'KATAKANA') and (scripts['HIRAGANA'] or scripts['KATAKANA']):
+        # any kana means japanese, the han characters are kanji
+        return 'ja', (scripts['CJK'] + scripts['HIRAGANA'] + scripts['KATAKANA']) / len(letters)
+    if script in uniqueScripts:
+        return uniqueScripts[script], share
+    if script == 'CJK':
+        # han characters without any kana are most likely chinese, but can't tell simplified from traditional,
+        # and japanese can be written that way too. never enough to skip or hint
+        return 'zh', share * 0.5
+    if script == 'CYRILLIC':
+        if any(char.lower() not in slavicCyrillic for char in letters if script_of(char) == 'CYRILLIC'):
+            return None, 0.0
+        return marker_language(letters, cyrillicMarkers, 'ru', share)
+    if script == 'ARABIC':
+        return marker_language(letters, arabicMarkers, 'ar', share)
+    if script == 'LATIN':
+        return trigram_language(text, share)
+    return None, 0.0
+
+
+def marker_language(letters, markers, default, share):
+    found = [language for language, chars in markers.items() if any(char.lower() in chars for char in letters)]
+    if len(found) == 1:
+        return found[0], share
+    if not found:
+        # no unique letters, the default is the most common language but it's a guess
+        return default, share * 0.7
+    return None, 0.0
+
+
+def trigram_language(text, share):
+    counts = trigrams(''.join(char if char.isalpha() or char == "'" else ' ' for char in text))
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    scores = sorted(
+        ((sum(profile.get(gram, 0) * count for gram, count in counts.items()) / norm, language) for language, profile in profiles.items()),
+        reverse=True
+    )
+    (best, language), (second, _) = scores[0], scores[1]
+    if best <= 0:
+        return None, 0.0
+    # confidence is how far ahead the best profile is, and grows with the amount of text up to 60 letters.
+    # it shrinks when even the best profile is a weak match, the text is likely a language without a profile
+    margin = 1 - second / best
+    confidence = min(1.0, 2 * margin) * min(1.0, sum(counts.values()) / 60) * min(1.0, best / matchScore) * share
+    if language in closeLanguages:
+        confidence = min(confidence, 0.5)
+    return language, confidence
+
+
+def stats():
+    return {
+        'checked': checked,
+        'avoided': avoided,
+        'hinted': hinted
+    }
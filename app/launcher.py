@@ -0,0 +1,123 @@
+import json
+import math
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# py files
+import gcp_secrets # used to get secrets from google secret manager
+import logger # used to write logs to google log explorer as well as to stdout
+
+'''
+Runs the bot as several worker processes on one host, each owning a contiguous range of shards.
+Each worker is main.py with shard_ids and shard_count set, so every worker has its own event loop, core and caches.
+python launcher.py
+env:
+    shard_count    total shards. defaults to discord's recommendation for the bot
+    shard_workers  worker processes. defaults to the number of cores
+Workers all start at once. They share a directory of identify lock files (see sharding.py), so each shard waits
+for its turn right before it identifies and the bot stays within its identify concurrency however long startup takes.
+A worker that exits is restarted after restartDelay, the other workers keep being watched meanwhile.
+'''
+
+restartDelay = 10 # seconds before a worker that exited is started again
+
+
+def gateway_info(token):
+    '''
+    Return (recommended shard count, identify max_concurrency) from discord
+    '''
+    request = urllib.request.Request(
+        'https://discord.com/api/v10/gateway/bot',
+        headers={'Authorization': f'Bot {token}', 'User-Agent': 'DiscordBot (discord-role-bot, 1.0)'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return data['shards'], data['session_start_limit']['max_concurrency']
+
+
+def shard_ranges(shardCount, workerCount):
+    # contiguous ranges, as even as possible
+    size = math.ceil(shardCount / workerCount)
+    return [list(range(start, min(start + size, shardCount))) for start in range(0, shardCount, size)]
+
+
+def start_worker(workerID, shardIDs, shardCount, identifyDir, maxConcurrency):
+    workerEnv = {
+        **os.environ,
+        'shard_ids': ','.join(str(shardID) for shardID in shardIDs),
+        'shard_count': str(shardCount),
+        'worker_id': str(workerID),
+        'identify_dir': identifyDir,
+        'identify_concurrency': str(maxConcurrency)
+    }
+    logger.write_log(
+        action=None,
+        payload=f'Starting worker {workerID} with shards {shardIDs[0]}-{shardIDs[-1]} of {shardCount}.',
+        severity='Info'
+    )
+    return subprocess.Popen([sys.executable, 'main.py'], env=workerEnv)
+
+
+def main():
+    recommended, maxConcurrency = gateway_info(gcp_secrets.get_bot_token())
+    shardCount = int(os.getenv('shard_count') or recommended)
+    workerCount = min(int(os.getenv('shard_workers') or os.cpu_count() or 1), shardCount)
+    ranges = shard_ranges(shardCount, workerCount)
+    logger.write_log(
+        action=None,
+        payload=f'Launching {len(ranges)} worker(s) for {shardCount} shard(s). Discord recommends {recommended}, identify concurrency {maxConcurrency}.',
+        severity='Info'
+    )
+
+    identifyDir = tempfile.mkdtemp(prefix='identify-')
+    workers = {}
+    restarts = {} # format: {workerID: time.monotonic() to start it again}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker in workers.values():
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # the identify lock files space out the shards, the workers don't need to be staggered here
+    for workerID, shardIDs in enumerate(ranges):
+        workers[workerID] = start_worker(workerID, shardIDs, shardCount, identifyDir, maxConcurrency)
+
+    while not stopping:
+        time.sleep(1)
+        now = time.monotonic()
+        for workerID, worker in list(workers.items()):
+            if stopping:
+                break
+            if workerID in restarts:
+                if now >= restarts[workerID]:
+                    del restarts[workerID]
+                    workers[workerID] = start_worker(workerID, ranges[workerID], shardCount, identifyDir, maxConcurrency)
+                continue
+            if worker.poll() is None:
+                continue
+            logger.write_log(
+                action=None,
+                payload=f'Worker {workerID} exited with code {worker.returncode}. Restarting in {restartDelay}s.',
+                severity='Warning'
+            )
+            restarts[workerID] = now + restartDelay
+
+    for worker in workers.values():
+        worker.wait()
+    shutil.rmtree(identifyDir, ignore_errors=True)
+    logger.shutdown()
+
+
+if __name__ == '__main__':
+    main()
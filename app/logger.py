@@ -1,7 +1,10 @@
-from google.cloud import logging as gcp_logging
 import logging
 from sys import stdout
+import atexit
+import collections
+import itertools
 import os
+import threading
 import traceback
 
 
@@ -13,11 +16,37 @@ Writes logs to google cloud logging with varying severity.
 Logs are separated by name, all logs will have the same name, discord-role-bot
 also writes logs to stdout for local debugging and transparency
 severity includes INFO, WARNING, ERROR, etc.
+
+write_log never waits on the network. Records go into a bounded in-memory queue and a background
+thread sends them to cloud logging in batches, either when log_batch_size records are waiting or
+every log_flush_interval seconds. Anything still queued is flushed when the process exits.
+Debug records are queued apart from the rest so a full queue can drop the oldest debug record without a scan.
+The cloud logging library is imported and its client created by init(), or by the first batch sent.
 '''
 
-# gcp logging setup
-client = gcp_logging.Client()
-gcp_logger = client.logger('discord-role-bot') # the log name
+# numeric severities used by cloud logging
+severityLevels = {
+    'DEFAULT': 0,
+    'DEBUG': 100,
+    'INFO': 200,
+    'NOTICE': 300,
+    'WARNING': 400,
+    'ERROR': 500,
+    'CRITICAL': 600,
+    'ALERT': 700,
+    'EMERGENCY': 800
+}
+minSeverity = severityLevels.get(os.getenv('log_level', 'Debug').upper(), severityLevels['DEBUG']) # records below this are dropped before they are formatted
+queueSize = int(os.getenv('log_queue_size', '10000'))
+batchSize = int(os.getenv('log_batch_size', '100'))
+flushInterval = float(os.getenv('log_flush_interval', '2'))
+# what to drop when the queue is full: drop-debug-first, drop-oldest or drop-newest
+overflowPolicy = os.getenv('log_overflow_policy', 'drop-debug-first')
+
+# gcp logging setup, see init()
+client = None
+gcp_logger = None
+clientLock = threading.Lock()
 
 # Docker logging setup
 logger = logging.getLogger('discord-role-bot')
@@ -28,33 +57,134 @@ consoleHandler = logging.StreamHandler(stdout) #set streamhandler to stderr
 consoleHandler.setFormatter(logFormatter)
 logger.addHandler(consoleHandler)
 
+# format: (sequence, struct, severity). batches take from whichever deque holds the older record, so order is kept
+records = collections.deque() # every severity except debug
+debugRecords = collections.deque()
+sequence = itertools.count()
+recordsReady = threading.Condition()
+dropped = 0
+stopping = False
+
+
 def write_log(action, payload, severity):
+    if severityLevels.get(str(severity).upper(), 0) < minSeverity:
+        return
     if isinstance(payload, BaseException):
         payload = ''.join(traceback.format_exception(type(payload), payload, payload.__traceback__))
-    try:
-        gcp_logger.log_struct(
-            {
-                "env": env
-                ,"action": action
-                ,"message": payload
-            }
-            ,severity=severity
-        )
-
-        #write docker log
-        if debug.lower()=='true':
-            logger.info(payload)
 
+    enqueue(
+        {
+            "env": env
+            ,"action": action
+            ,"message": payload
+        }
+        ,severity
+    )
+
+    #write docker log
+    if str(debug).lower()=='true':
+        logger.info(payload)
+
+
+def queued():
+    return len(records) + len(debugRecords)
+
+
+def pop_oldest():
+    # call with recordsReady held and at least one record queued
+    if not debugRecords or (records and records[0][0] < debugRecords[0][0]):
+        return records.popleft()
+    return debugRecords.popleft()
+
+
+def enqueue(struct, severity):
+    global dropped
+    isDebug = str(severity).upper() == 'DEBUG'
+    with recordsReady:
+        if queued() >= queueSize:
+            dropped += 1
+            if overflowPolicy == 'drop-newest':
+                return
+            if overflowPolicy == 'drop-debug-first':
+                if debugRecords:
+                    debugRecords.popleft()
+                elif isDebug:
+                    return
+                else:
+                    records.popleft()
+            else:
+                pop_oldest()
+        (debugRecords if isDebug else records).append((next(sequence), struct, severity))
+        if queued() >= batchSize:
+            recordsReady.notify()
+
+
+def init():
+    '''
+    Create the cloud logging client. Safe to call from several threads, only the first call does any work.
+    '''
+    global client, gcp_logger
+    with clientLock:
+        if gcp_logger is None:
+            from google.cloud import logging as gcp_logging
+            client = gcp_logging.Client()
+            gcp_logger = client.logger('discord-role-bot') # the log name
+    return gcp_logger
+
+
+def send_batch():
+    '''
+    Send up to batchSize queued records to cloud logging in one request
+    '''
+    with recordsReady:
+        batch = [pop_oldest() for _ in range(min(batchSize, queued()))]
+    if not batch:
+        return
+    try:
+        gcpBatch = (gcp_logger or init()).batch()
+        for _, struct, severity in batch:
+            gcpBatch.log_struct(struct, severity=severity)
+        gcpBatch.commit()
     except Exception as e:
-        gcp_logger.log_struct(
-            {
-                "env": env
-                ,"action": action
-                ,"message": 'Failed to write log. Error: ' + str(e)
-            }
-            ,severity=severity
-        )
-
-        #write docker log
-        if debug.lower()=='true':
-            logger.info(payload)
\ No newline at end of file
+        # cloud logging is unreachable, don't lose the error
+        logger.error(f'Failed to write {len(batch)} log(s). Error: {e}')
+
+
+def flush_worker():
+    while True:
+        with recordsReady:
+            if not stopping and queued() < batchSize:
+                recordsReady.wait(timeout=flushInterval)
+            done = stopping
+        while queued():
+            send_batch()
+            if queued() < batchSize and not done:
+                break
+        if done:
+            return
+
+
+def flush():
+    '''
+    Send every queued record now. Blocks until they are sent.
+    '''
+    while queued():
+        send_batch()
+
+
+def shutdown():
+    global stopping
+    with recordsReady:
+        if stopping:
+            return
+        stopping = True
+        recordsReady.notify()
+    worker.join(timeout=10)
+    flush()
+    if dropped:
+        logger.warning(f'Dropped {dropped} log(s) because the log queue was full.')
+
+
+worker = threading.Thread(target=flush_worker, name='log-flush', daemon=True)
+worker.start()
+atexit.register(shutdown)
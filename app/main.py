@@ -1,11 +1,22 @@
+import startup # startup timing, imported first so it sees the whole startup
 import discord
 from discord.ext import commands
+import asyncio
 import os
+import signal
 from pathlib import Path
 
 # py files
 import gcp_secrets # function to retrieve discord private key from gcp secret manager
+import firestore # used to talk to firestore
+import sharding # shard assignment and per-shard stats
+import metrics # prometheus endpoint
+import command_sync # syncs /commands to discord only when they change
+import gateway_recording # records gateway events for bench/replay.py
 import logger # used to write logs to google log explorer as well as to stdout
+import gcp_translate # translating in google translation api
+import rest_scheduler # rate limit aware queue for discord REST calls
+startup.mark('imports')
 
 
 intents = discord.Intents.default()
@@ -19,49 +30,79 @@ if env=='dev':
     secretName = "discord-role-bot-token-dev"
 elif env=='prod':
     secretName = "discord-role-bot-token"
+# the google backends are independent, initialize them all at once on startup threads.
+# only the secrets are needed before connecting, firestore is waited for in setup_hook
+startup.start_backends({
+    'secrets': gcp_secrets.prefetch, # loads every secret the bot uses in parallel so nothing waits on secret manager later
+    'firestore': firestore.init,
+    'logging': logger.init,
+    'translate': gcp_translate.get_client
+})
+failedSecrets = startup.wait_backend('secrets')
+if failedSecrets:
+    logger.write_log(
+        action=None,
+        payload=f"Failed to prefetch secret(s) {failedSecrets}. They will be fetched on first use.",
+        severity='Warning'
+    )
 token = gcp_secrets.get_secret_contents(secretName)
 
 
+# sharding. by default discord picks the shard count and every shard runs in this process.
+# launcher.py runs several processes instead and gives each one a range of shards
+shardCount = os.getenv('shard_count')
+shardIDs = sharding.parse_shard_ids(os.getenv('shard_ids'))
+
+
 # create connection
-class Client(commands.Bot):
+class Client(commands.AutoShardedBot):
     def __init__(self):
-        super().__init__(command_prefix='!', intents=intents)
+        super().__init__(
+            command_prefix='!',
+            intents=intents,
+            shard_count=int(shardCount) if shardCount else None,
+            shard_ids=shardIDs,
+            tree_cls=metrics.MetricsTree, # times every /command
+            http_trace=rest_scheduler.trace_config(), # rate limit headers pace the scheduler's route buckets
+            enable_debug_events=bool(gateway_recording.recordPath) # raw gateway messages, only needed while recording
+        )
 
         self.cog_dir = Path('cogs')  # directory containing the cogs
 
     # loop through all files in the cogs folder. load each one into the bot
     async def setup_hook(self):
-        for subdir, dirs, files in os.walk(self.cog_dir):
-            for file in files:
-                if file.endswith('.py') and file != 'CogTemplate.py': # ignore the template, its not a real cog
-                    path = Path(subdir, file).relative_to('.')
-                    cog = str(path.with_suffix('')).replace('/', '.')
-                    await self.load_extension(cog) # load them into the bot
+        # docker stop and the launcher send SIGTERM. close the connection so bot.run returns and queued logs are flushed
+        # without a handler the process dies straight away and atexit never runs
+        self.loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.close()))
 
-    async def on_ready(self):
-        logger.write_log(
-            action=None,
-            payload='Bot has logged in.',
-            severity='Debug'
-        )    
-        try:
-            # syncing is used for /commands
-            # Its used to show /command options available for users in discord itself. They're called trees in discord
-            # by not defining a guild_id its considered a global tree. it can take up to 24 hours to refresh on servers
-            # TODO: I shouldn't have this here because every time the shard invalidates it re-syncs the functions.
-            '''
-            2023-04-20 22:36:42 INFO     discord.gateway Shard ID None session has been invalidated.
-            2023-04-20 22:36:47 INFO     discord.gateway Shard ID None has connected to Gateway (Session ID: 08fa2f592630f7558353482ffbd1f724).
-            bot is logged in
-            synced 2 command(s)
-            '''
-            synced = await self.tree.sync()
-            logger.write_log(
-                action=None,
-                payload=f"synced {len(synced)} command(s)",
-                severity='Debug'
-            )
+        with startup.phase('cogs'):
+            for subdir, dirs, files in os.walk(self.cog_dir):
+                for file in files:
+                    if file.endswith('.py') and file != 'CogTemplate.py': # ignore the template, its not a real cog
+                        path = Path(subdir, file).relative_to('.')
+                        cog = str(path.with_suffix('')).replace('/', '.')
+                        await self.load_extension(cog) # load them into the bot
+
+        # serve /metrics on port 5000
+        await metrics.start(self)
 
+        # load every guild's role messages, roles and auto translate channels before any events arrive
+        # a worker only keeps the guilds on its own shards
+        await startup.backend_ready('firestore')
+        with startup.phase('preload'):
+            await firestore.preload_guilds(lambda guildID: sharding.owns_guild(self, guildID))
+
+        with startup.phase('command sync'):
+            await self.sync_commands()
+
+    async def sync_commands(self):
+        # syncing is used for /commands
+        # Its used to show /command options available for users in discord itself. They're called trees in discord
+        # once a sync succeeds the process never syncs again, so reconnects and session invalidations don't re-sync
+        # commands are global, only the worker with shard 0 syncs them
+        try:
+            if self.shard_ids is None or 0 in self.shard_ids:
+                await command_sync.sync_commands(self.tree)
         except Exception as e:
             logger.write_log(
                 action=None,
@@ -69,9 +110,34 @@ class Client(commands.Bot):
                 severity='Error'
             )
 
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        # launcher.py workers share one identify limit, wait for this shard's turn across all of them
+        if sharding.identifyDir:
+            await sharding.wait_identify(shard_id)
+        else:
+            await super().before_identify_hook(shard_id, initial=initial)
+
+    async def on_ready(self):
+        logger.write_log(
+            action=None,
+            payload='Bot has logged in.',
+            severity='Debug'
+        )
+        # a sync that failed in setup_hook is tried again, sync_commands returns straight away once one succeeded
+        await self.sync_commands()
+        # on_ready fires again after reconnects, the breakdown is only logged the first time
+        breakdown = startup.ready()
+        if breakdown:
+            logger.write_log(
+                action='startup',
+                payload=breakdown,
+                severity='Info'
+            )
+
 
 bot = Client()
 bot.run(token)
+logger.shutdown() # send the logs still queued before the process exits
 
 
 # TODO: Need to create an additional cog, UpdateRole? Or duplicate the code througout. The remove_role command doesnt reset the embedded message.
@@ -0,0 +1,67 @@
+import asyncio
+import collections
+import os
+import time
+
+# py files
+import rest_scheduler # rate limit aware queue for discord REST calls
+
+'''
+Member lookups that avoid a REST round trip whenever possible.
+1. the gateway member cache (guild.get_member), free when the members intent is on
+2. a small LRU of members fetched recently, for members the gateway cache doesn't hold
+3. guild.fetch_member through the REST scheduler. concurrent misses for the same member share one request
+'''
+
+maxSize = int(os.getenv('member_cache_size', '1000'))
+ttl = float(os.getenv('member_cache_ttl', '60')) # fetched members go stale, their roles can change
+
+recentMembers = collections.OrderedDict() # format: {(guildID, userID): (fetched at, member)}
+inflight = {} # format: {(guildID, userID): future for the fetch in progress}
+
+# stats
+hits = 0
+misses = 0
+
+
+async def resolve_member(guild, userID):
+    '''
+    Return the member object for userID in guild
+    '''
+    global hits, misses
+    member = guild.get_member(userID)
+    if member is not None:
+        hits += 1
+        return member
+
+    key = (guild.id, userID)
+    cached = recentMembers.get(key)
+    if cached and time.monotonic() - cached[0] < ttl:
+        recentMembers.move_to_end(key)
+        hits += 1
+        return cached[1]
+
+    misses += 1
+    if key not in inflight:
+        inflight[key] = asyncio.ensure_future(fetch_member(guild, userID))
+    return await asyncio.shield(inflight[key])
+
+
+async def fetch_member(guild, userID):
+    key = (guild.id, userID)
+    try:
+        member = await rest_scheduler.submit(guild.id, guild.fetch_member, userID)
+        recentMembers[key] = (time.monotonic(), member)
+        recentMembers.move_to_end(key)
+        while len(recentMembers) > maxSize:
+            recentMembers.popitem(last=False)
+        return member
+    finally:
+        inflight.pop(key, None)
+
+
+def forget_member(guildID, userID):
+    '''
+    Drop a fetched member after the bot changes it so the next lookup isn't stale
+    '''
+    recentMembers.pop((guildID, userID), None)
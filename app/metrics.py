@@ -0,0 +1,185 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+from discord import app_commands
+from aiohttp import web
+
+# py files
+import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+import member_cache # member lookups
+import translate_cache # memoized translation results
+import language_id # offline language detection
+import sharding # shard assignment and per-shard stats
+import startup # startup timing
+
+'''
+Prometheus metrics served over http on metrics_port (default 5000, the port docker_run.sh publishes).
+Workers started by launcher.py listen on metrics_port + worker_id so they don't collide.
+Latencies are histograms, recorded with timer() or timed_listener. Counters that other modules already keep
+(rest scheduler, caches, shards) are read when the endpoint is scraped instead of being copied on every event.
+'''
+
+port = int(os.getenv('metrics_port', '5000')) + int(os.getenv('worker_id', '0'))
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # seconds
+
+# firestore listeners, translate and secret manager calls record from other threads
+lock = threading.Lock()
+histograms = {} # format: {name: {labels: [count per bucket..., count above the last bucket, sum, count]}}
+descriptions = {
+    'discord_listener_seconds': 'Time spent in a gateway event listener',
+    'discord_command_seconds': 'Time from a command being invoked to it finishing',
+    'firestore_request_seconds': 'Firestore request latency',
+    'translate_request_seconds': 'Google translate request latency',
+    'secret_manager_request_seconds': 'Secret manager request latency'
+}
+runner = None
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+
+def observe(name, seconds, **labels):
+    key = tuple(sorted(labels.items()))
+    with lock:
+        series = histograms.setdefault(name, {}).get(key)
+        if series is None:
+            series = histograms[name][key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(buckets, seconds)] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    '''
+    with metrics.timer('firestore_request_seconds', operation='get'):
+    Records the time spent in the block with status="ok" or status="error". Works in threads and coroutines.
+    '''
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, status=status, **labels)
+
+
+def timed_listener(func):
+    '''
+    Decorator for cog listeners. Goes under @commands.Cog.listener()
+    '''
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with timer('discord_listener_seconds', listener=func.__name__):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class MetricsTree(app_commands.CommandTree):
+    '''
+    Command tree that records when each /command starts, so its latency can be observed on completion
+    '''
+    async def interaction_check(self, interaction):
+        interaction.extras['started'] = time.perf_counter()
+        return True
+
+
+def command_completed(name, started):
+    if started is not None:
+        observe('discord_command_seconds', time.perf_counter() - started, command=name)
+
+
+def render_histograms(lines):
+    with lock:
+        snapshot = {name: {key: list(series) for key, series in allSeries.items()} for name, allSeries in histograms.items()}
+    for name, allSeries in sorted(snapshot.items()):
+        lines.append(f'# HELP {name} {descriptions.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, series in sorted(allSeries.items()):
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{label_text(key + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{label_text(key + (("le", "+Inf"),))} {series[-1]}')
+            lines.append(f'{name}_sum{label_text(key)} {series[-2]}')
+            lines.append(f'{name}_count{label_text(key)} {series[-1]}')
+
+
+def add_metric(lines, name, metricType, description, samples):
+    lines.append(f'# HELP {name} {description}')
+    lines.append(f'# TYPE {name} {metricType}')
+    for labels, value in samples:
+        lines.append(f'{name}{label_text(tuple(labels.items()))} {value}')
+
+
+def render(bot):
+    lines = []
+    render_histograms(lines)
+
+    restStats = rest_scheduler.stats()
+    priorities = {rest_scheduler.INTERACTION: 'interaction', rest_scheduler.NORMAL: 'normal', rest_scheduler.BACKGROUND: 'background'}
+    add_metric(lines, 'discord_rest_requests_total', 'counter', 'REST requests completed by the scheduler', [({}, restStats['completed'])])
+    # 429s are retried inside discord.py, rest_scheduler counts them from the responses its trace sees
+    add_metric(lines, 'discord_rest_rate_limited_total', 'counter', '429 responses discord.py got back and retried', [({}, restStats['rateLimited'])])
+    add_metric(lines, 'discord_rest_retry_after_seconds_total', 'counter', 'Retry after seconds discord sent with those 429s', [({}, restStats['retryAfterTotal'])])
+    add_metric(lines, 'discord_rest_scheduler_wait_seconds_total', 'counter', 'Time requests spent queued in the scheduler before they were sent', [({}, restStats['waitTotal'])])
+    add_metric(lines, 'discord_rest_queued', 'gauge', 'REST requests waiting in the scheduler', [({'priority': priorities[priority]}, count) for priority, count in restStats['queued'].items()])
+
+    shardStats = sharding.stats(bot)
+    add_metric(lines, 'discord_gateway_latency_seconds', 'gauge', 'Heartbeat latency per shard', [({'shard': shardID}, stats['latency']) for shardID, stats in shardStats.items() if stats['latency'] == stats['latency']]) # skip nan before the first heartbeat
+    add_metric(lines, 'discord_gateway_events_total', 'counter', 'Gateway events received per shard', [({'shard': shardID}, stats['events']) for shardID, stats in shardStats.items()])
+    add_metric(lines, 'discord_gateway_disconnects_total', 'counter', 'Shard disconnects', [({'shard': shardID}, stats['disconnects']) for shardID, stats in shardStats.items()])
+
+    translateStats = translate_cache.stats()
+    caches = {
+        'member': (member_cache.hits, member_cache.misses),
+        'translate': (translateStats['hits'] + translateStats['diskHits'], translateStats['misses'])
+    }
+    add_metric(lines, 'cache_hits_total', 'counter', 'Lookups served from a cache', [({'cache': cache}, hits) for cache, (hits, misses) in caches.items()])
+    add_metric(lines, 'cache_misses_total', 'counter', 'Lookups that missed a cache', [({'cache': cache}, misses) for cache, (hits, misses) in caches.items()])
+    add_metric(lines, 'cache_hit_ratio', 'gauge', 'Share of lookups served from a cache', [({'cache': cache}, hits / (hits + misses) if hits + misses else 0.0) for cache, (hits, misses) in caches.items()])
+
+    detectStats = language_id.stats()
+    add_metric(lines, 'translate_local_detection_total', 'counter', 'Translations checked by local language detection', [
+        ({'result': 'avoided'}, detectStats['avoided']),
+        ({'result': 'hinted'}, detectStats['hinted']),
+        ({'result': 'checked'}, detectStats['checked'])
+    ])
+    add_metric(lines, 'bot_startup_seconds', 'gauge', 'Time spent in each startup phase', [({'phase': name}, seconds) for name, seconds in list(startup.phases.items())])
+    return '\n'.join(lines) + '\n'
+
+
+async def start(bot):
+    '''
+    Serve /metrics on the bot's event loop. Called from setup_hook.
+    '''
+    global runner
+    if runner is not None:
+        return
+
+    async def handle_metrics(request):
+        return web.Response(text=render(bot), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    logger.write_log(
+        action=None,
+        payload=f'Serving metrics on port {port}.',
+        severity='Debug'
+    )
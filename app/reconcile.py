@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+import discord
+
+# py files
+import firestore # used to talk to firestore
+import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+import role_queue # applies role changes to a member in one edit
+
+'''
+Brings roles back in line with the reactions on the role messages, for reactions added or removed while the bot was
+down or disconnected. The live listeners in OnReactionEvents only see reactions made while the bot is connected.
+For every role message the reactors of each configured emote are paged 100 at a time, then compared as id sets with the
+members holding the role in the gateway member cache. Only the difference is sent: one edit per member that needs a change.
+Every REST call goes through the rest scheduler at background priority, so live reactions and commands go first.
+Edits are handed to the scheduler as many at a time as discord's rate limit headers allow on the member edit route,
+so a big guild drains at discord's pace instead of a fixed concurrency.
+Revoking can be left out (revoke=False): a role held without a reaction may have been given by an admin or another bot,
+so the automatic run at connect only grants unless reconcile_revoke_on_connect is set. /reconcile_roles does both.
+An emote with no reactions at all (not even the bot's) usually means the reactions were cleared, not that nobody wants the role,
+so its role is only revoked when revokeUnreacted is set.
+'''
+
+pageSize = 100 # most users discord returns per reaction page
+maxConcurrency = int(os.getenv('reconcile_concurrency', '50')) # most member edits waiting in the rest scheduler at once
+
+running = {} # format: {(guildID, revoke, revokeUnreacted): task reconciling that guild}, concurrent callers share it
+
+
+async def fetch_reactor_page(reaction, after):
+    return [user async for user in reaction.users(limit=pageSize, after=after)]
+
+
+async def fetch_reactors(guild, reaction):
+    '''
+    Return the ids of every user who reacted, one REST call per page
+    '''
+    reactors = set()
+    pages = 0
+    after = None
+    while True:
+        page = await rest_scheduler.submit(guild.id, fetch_reactor_page, reaction, after, priority=rest_scheduler.BACKGROUND, route='Reaction.users')
+        pages += 1
+        reactors.update(user.id for user in page)
+        if len(page) < pageSize:
+            return reactors, pages
+        after = discord.Object(id=page[-1].id) # pages are in ascending user id order
+
+
+async def message_reactors(guild, config, roles):
+    '''
+    Return ({roleID: reactor ids}, ids of roles with an emote nobody reacted with, pages fetched) for one role message
+    '''
+    channel = guild.get_channel(int(config['channelID']))
+    if channel is None:
+        raise LookupError(f"channel {config['channelID']} no longer exists")
+    message = await rest_scheduler.submit(guild.id, channel.fetch_message, int(config['messageID']), priority=rest_scheduler.BACKGROUND)
+    reactions = {str(reaction.emoji): reaction for reaction in message.reactions}
+
+    # an emote nobody reacted with isn't in message.reactions
+    emoteReactors = {}
+    fetches = []
+    for role in roles:
+        reaction = reactions.get(role['roleEmote'])
+        if reaction is not None and role['roleEmote'] not in emoteReactors:
+            emoteReactors[role['roleEmote']] = None
+            fetches.append((role['roleEmote'], fetch_reactors(guild, reaction)))
+    results = await asyncio.gather(*[fetch for emote, fetch in fetches])
+
+    pages = 1 # fetch_message
+    for (emote, fetch), (reactors, emotePages) in zip(fetches, results):
+        emoteReactors[emote] = reactors
+        pages += emotePages
+    roleReactors = {}
+    unreactedRoles = set()
+    for role in roles:
+        roleReactors.setdefault(int(role['roleID']), set()).update(emoteReactors.get(role['roleEmote']) or ())
+        if role['roleEmote'] not in reactions:
+            unreactedRoles.add(int(role['roleID']))
+    return roleReactors, unreactedRoles, pages
+
+
+async def plan_guild(guild, revoke=True, revokeUnreacted=False):
+    '''
+    Return ({memberID: {roleID: True to grant / False to revoke}}, stats) without changing anything
+    revoke: False to only plan grants
+    revokeUnreacted: also revoke roles whose emote has no reactions on the message
+    '''
+    stats = {'messages': 0, 'pages': 0, 'reactors': 0, 'grants': 0, 'revokes': 0, 'skippedRoles': 0, 'unreactedRoles': 0, 'errors': []}
+    if not guild.chunked:
+        await guild.chunk() # role holders come from the member cache, make sure it's complete
+
+    # a role can be on several messages or emotes, a member keeps it if they reacted with any of them
+    roleReactors = {}
+    incompleteRoles = set()
+    unreactedRoles = set()
+    for config, roles in await firestore.list_role_messages(guild.id):
+        stats['messages'] += 1
+        try:
+            messageReactors, messageUnreacted, pages = await message_reactors(guild, config, roles)
+            unreactedRoles.update(messageUnreacted)
+            stats['pages'] += pages
+            for roleID, reactors in messageReactors.items():
+                roleReactors.setdefault(roleID, set()).update(reactors)
+        except Exception as e:
+            # without every reactor a revoke could be wrong, leave this message's roles alone
+            stats['errors'].append(f"message {config['messageID']}: {e}")
+            incompleteRoles.update(int(role['roleID']) for role in roles)
+
+    changes = {}
+    botID = guild.me.id # the bot reacts with every emote itself
+    for roleID, reactors in roleReactors.items():
+        role = guild.get_role(roleID)
+        if role is None or roleID in incompleteRoles:
+            stats['skippedRoles'] += 1
+            continue
+        reactors.discard(botID)
+        stats['reactors'] += len(reactors)
+        holders = {member.id for member in role.members}
+        holders.discard(botID)
+        for memberID in reactors - holders:
+            if guild.get_member(memberID) is not None: # reactors who left the server can't be given roles
+                changes.setdefault(memberID, {})[roleID] = True
+                stats['grants'] += 1
+        if not revoke:
+            continue
+        if roleID in unreactedRoles and not revokeUnreacted:
+            stats['unreactedRoles'] += 1
+            continue
+        for memberID in holders - reactors:
+            changes.setdefault(memberID, {})[roleID] = False
+            stats['revokes'] += 1
+    return changes, stats
+
+
+def edit_slots(guild):
+    '''
+    Member edits to keep in the rest scheduler at once: discord's burst for the guild's member edit route, read from
+    its rate limit headers, capped at reconcile_concurrency
+    '''
+    return max(1, min(maxConcurrency, int(rest_scheduler.burst(guild.id, role_queue.editRoute))))
+
+
+async def apply_changes(guild, changes):
+    '''
+    One edit per member, only as many queued at once as the member edit route can take in one burst,
+    so the rest scheduler isn't handed thousands of edits at once
+    '''
+    applied = 0
+
+    async def apply(memberID, memberChanges):
+        nonlocal applied
+        # skipped if the member reacted since the reactors were read, the live listener has the newer intent
+        if await role_queue.apply_now(guild, memberID, memberChanges, priority=rest_scheduler.BACKGROUND, reason='Role selection reconciliation'):
+            applied += 1
+
+    tasks = set()
+    for memberID, memberChanges in changes.items():
+        # the slots are read again as edits finish, they follow the headers of the edits already sent
+        while len(tasks) >= edit_slots(guild):
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        tasks.add(asyncio.ensure_future(apply(memberID, memberChanges)))
+    if tasks:
+        await asyncio.gather(*tasks)
+    return applied
+
+
+async def run_guild(guild, dryRun=False, revoke=True, revokeUnreacted=False):
+    start = time.monotonic()
+    changes, stats = await plan_guild(guild, revoke, revokeUnreacted)
+    stats['members'] = len(changes)
+    stats['applied'] = 0 if dryRun else await apply_changes(guild, changes)
+    stats['seconds'] = round(time.monotonic() - start, 2)
+    logger.write_log(
+        action='reconcile',
+        payload=f"{'Planned' if dryRun else 'Reconciled'} roles for guild {guild.id}: {stats}",
+        severity='Warning' if stats['errors'] else 'Info'
+    )
+    return stats
+
+
+async def reconcile_guild(guild, dryRun=False, revoke=True, revokeUnreacted=False):
+    '''
+    Reconcile one guild and return its stats. A guild already being reconciled the same way isn't started twice, the caller waits for that run.
+    '''
+    if dryRun:
+        return await run_guild(guild, dryRun=True, revoke=revoke, revokeUnreacted=revokeUnreacted)
+    key = (guild.id, revoke, revokeUnreacted)
+    if key not in running:
+        running[key] = asyncio.ensure_future(run_guild(guild, revoke=revoke, revokeUnreacted=revokeUnreacted))
+        running[key].add_done_callback(lambda task: running.pop(key, None))
+    return await asyncio.shield(running[key])
+
+
+async def reconcile_guilds(guilds, revoke=True):
+    '''
+    Reconcile every guild with role messages. Used after a shard connects, failures are logged per guild.
+    '''
+    guilds = [guild for guild in guilds if firestore.roleCache.get(guild.id)]
+    results = await asyncio.gather(*[reconcile_guild(guild, revoke=revoke) for guild in guilds], return_exceptions=True)
+    for guild, result in zip(guilds, results):
+        if isinstance(result, Exception):
+            logger.write_log(
+                action='reconcile',
+                payload=f'Reconciling guild {guild.id} failed: {result}',
+                severity='Error'
+            )
+    return results
@@ -0,0 +1,270 @@
+import asyncio
+import collections
+import contextvars
+import os
+import time
+
+import aiohttp
+
+'''
+Central scheduler for discord REST calls.
+Cogs submit work here instead of awaiting the API directly so one guild's reaction storm can't starve everyone else.
+- a global token bucket caps total requests per second for the bot
+- each guild has one token bucket per route (the discord.py method called, Member.edit, Message.add_reaction...),
+  so a burst of role edits doesn't hold back reactions or message edits in the same guild
+- route buckets start at rest_route_rate and are reseeded from discord's X-RateLimit headers once a response comes back.
+  trace_config() hooks discord.py's aiohttp session to read them, the job that made the request is found through a context variable
+- a 429 holds the route (or every route, for a global limit) back until discord's Retry-After has passed.
+  discord.py still does its own header based waiting and retries 429s itself, the scheduler only keeps work from piling up behind it
+- guild routes are served round robin inside each priority level so a busy guild can't hold the queue
+- interaction responses go first and skip the route bucket, they have to land inside discord's 3 second deadline.
+  a few workers only serve interaction responses, so they never wait behind workers stuck in a rate limit retry
+
+usage:
+    await rest_scheduler.submit(guild.id, message.add_reaction, emote)
+    await rest_scheduler.submit(guild.id, interaction.followup.send, 'hi', priority=rest_scheduler.INTERACTION)
+'''
+
+# priorities, lower is served first
+INTERACTION = 0 # interaction responses and follow ups
+NORMAL = 1 # role edits, reactions, message edits
+BACKGROUND = 2 # admin DMs and anything else nobody is waiting on
+
+globalRate = float(os.getenv('rest_global_rate', '50')) # requests per second for the whole bot
+# per guild and route until discord's headers for it have been seen
+routeRate = float(os.getenv('rest_route_rate', '10')) # requests per second
+routeBurst = float(os.getenv('rest_route_burst', '10')) # requests that can go back to back
+workerCount = int(os.getenv('rest_workers', '8')) # requests in flight at once
+interactionWorkerCount = int(os.getenv('rest_interaction_workers', '2')) # extra workers that only send interaction responses
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blockedUntil = 0
+        self.window = 0.0 # longest reset after discord has sent for this bucket, about the length of its window
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        '''
+        Seconds until a token is available, 0 if one is available now
+        '''
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        self.blockedUntil = max(self.blockedUntil, time.monotonic() + seconds)
+
+    def observe(self, limit, remaining, resetAfter):
+        '''
+        Reseed from discord's X-RateLimit headers: limit requests per window, remaining left in this window,
+        resetAfter seconds until the window resets
+        '''
+        self.window = max(self.window, resetAfter)
+        if limit > 0 and self.window > 0:
+            self.capacity = limit
+            self.rate = limit / self.window
+        self.refill(time.monotonic())
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.block(resetAfter)
+
+
+def route_of(func):
+    '''
+    Key for the route bucket a call is paced by. Bound methods give Member.edit, Message.add_reaction...
+    '''
+    return getattr(func, '__qualname__', None) or type(func).__qualname__
+
+
+class Job:
+    def __init__(self, guildID, func, args, kwargs, future, route=None):
+        self.guildID = guildID
+        self.route = route or route_of(func)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class RestScheduler:
+    def __init__(self):
+        self.globalBucket = TokenBucket(globalRate, globalRate)
+        self.routeBuckets = {} # format: {(guildID, route): TokenBucket}
+        # format: {priority: OrderedDict{(guildID, route): deque of jobs}}. key order is the round robin order
+        self.queues = {priority: collections.OrderedDict() for priority in (INTERACTION, NORMAL, BACKGROUND)}
+        self.workers = []
+        self.wakeup = None
+        # stats
+        self.completed = 0
+        self.rateLimited = 0 # 429s discord sent back, discord.py retries them
+        self.retryAfterTotal = 0.0 # seconds discord told us to wait across those 429s
+        self.waitTotal = 0.0
+        self.recentWaits = collections.deque(maxlen=1000)
+
+    def start(self):
+        # asyncio objects are created on first use so they bind to the bot's running loop
+        self.wakeup = asyncio.Event()
+        self.workers = [asyncio.ensure_future(self.worker()) for _ in range(workerCount)]
+        self.workers += [asyncio.ensure_future(self.worker(interactionsOnly=True)) for _ in range(interactionWorkerCount)]
+
+    def route_bucket(self, key):
+        bucket = self.routeBuckets.get(key)
+        if bucket is None:
+            bucket = self.routeBuckets[key] = TokenBucket(routeRate, routeBurst)
+        return bucket
+
+    async def submit(self, guildID, func, *args, priority=NORMAL, route=None, **kwargs):
+        '''
+        Queue func(*args, **kwargs) and wait for its result. Exceptions from the call are raised here.
+        guildID can be None for work that isn't tied to a guild (DMs).
+        route: bucket the call is paced by, for wrappers around a discord.py method. Defaults to func's name
+        '''
+        if not self.workers:
+            self.start()
+        future = asyncio.get_event_loop().create_future()
+        job = Job(guildID, func, args, kwargs, future, route)
+        self.queues[priority].setdefault((guildID, job.route), collections.deque()).append(job)
+        self.wakeup.set()
+        return await future
+
+    def pick(self, interactionsOnly=False):
+        '''
+        Return (job, None) for the next job that may run now, or (None, seconds to wait) if every queue is throttled.
+        '''
+        now = time.monotonic()
+        wait = self.globalBucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+
+        wait = None
+        for priority, routes in self.queues.items():
+            if interactionsOnly and priority != INTERACTION:
+                break
+            for key in list(routes):
+                bucket = self.route_bucket(key)
+                routeWait = 0 if priority == INTERACTION else bucket.wait_time(now)
+                if routeWait > 0:
+                    wait = routeWait if wait is None else min(wait, routeWait)
+                    continue
+
+                jobs = routes[key]
+                job = jobs.popleft()
+                if jobs:
+                    routes.move_to_end(key) # next guild route gets the next turn
+                else:
+                    del routes[key]
+                self.globalBucket.take()
+                if priority != INTERACTION:
+                    bucket.take()
+                return job, None
+        return None, wait
+
+    async def worker(self, interactionsOnly=False):
+        while True:
+            job, wait = self.pick(interactionsOnly)
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run(job)
+
+    async def run(self, job):
+        if job.future.cancelled(): # the caller stopped waiting
+            return
+        waited = time.monotonic() - job.enqueued
+        self.waitTotal += waited
+        self.recentWaits.append(waited)
+        currentJob.set(job) # read by the aiohttp trace hooks while discord.py makes the request
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self.completed += 1
+
+    def observe(self, job, status, headers):
+        '''
+        Called with every discord response a scheduled job gets back. Reseeds the job's route bucket from the
+        X-RateLimit headers and holds it (or everyone, on a global limit) back after a 429.
+        '''
+        bucket = self.route_bucket((job.guildID, job.route))
+        if status == 429:
+            retryAfter = float(headers.get('Retry-After') or headers.get('X-RateLimit-Reset-After') or 0)
+            self.rateLimited += 1
+            self.retryAfterTotal += retryAfter
+            if headers.get('X-RateLimit-Global', '').lower() == 'true':
+                self.globalBucket.block(retryAfter)
+            else:
+                bucket.block(retryAfter)
+        elif 'X-RateLimit-Limit' in headers:
+            bucket.observe(
+                int(headers['X-RateLimit-Limit']),
+                int(headers.get('X-RateLimit-Remaining', 0)),
+                float(headers.get('X-RateLimit-Reset-After', 0))
+            )
+
+    def burst(self, guildID, route):
+        '''
+        Requests discord lets the guild make back to back on route, from its last rate limit headers
+        '''
+        return self.route_bucket((guildID, route)).capacity
+
+    def stats(self):
+        '''
+        Queue depth and wait times, for debugging and monitoring
+        '''
+        waits = sorted(self.recentWaits)
+        return {
+            'queued': {priority: sum(len(jobs) for jobs in guilds.values()) for priority, guilds in self.queues.items()},
+            'guildsWaiting': len({guildID for routes in self.queues.values() for guildID, route in routes}),
+            'completed': self.completed,
+            'rateLimited': self.rateLimited,
+            'retryAfterTotal': self.retryAfterTotal,
+            'waitTotal': self.waitTotal,
+            'waitP50': waits[len(waits) // 2] if waits else 0.0,
+            'waitMax': waits[-1] if waits else 0.0
+        }
+
+
+async def on_request_end(session, context, params):
+    job = currentJob.get()
+    if job is not None:
+        scheduler.observe(job, params.response.status, params.response.headers)
+
+
+def trace_config():
+    '''
+    aiohttp trace for the bot's HTTP session, pass it to the client as http_trace.
+    Every response to a scheduled call is handed to the scheduler with its rate limit headers.
+    '''
+    config = aiohttp.TraceConfig()
+    config.on_request_end.append(on_request_end)
+    return config
+
+
+currentJob = contextvars.ContextVar('currentJob', default=None) # the job a worker is running
+scheduler = RestScheduler()
+submit = scheduler.submit
+burst = scheduler.burst
+stats = scheduler.stats
@@ -0,0 +1,53 @@
+import discord
+
+'''
+Per-guild index of role name -> role id.
+Replaces discord.utils.get(guild.roles, name=...) which scans every role in the guild.
+The index is built the first time a guild is used and kept current by the role create/update/delete
+gateway events in cogs/RoleSelection/OnRoleEvents.py
+'''
+
+# format: {guildID: {roleName: roleID}}
+roleNames = {}
+
+
+def build(guild):
+    # guild.roles is ordered bottom to top. keep the first match so results agree with discord.utils.get
+    names = {}
+    for role in guild.roles:
+        names.setdefault(role.name, role.id)
+    roleNames[guild.id] = names
+    return names
+
+
+def forget(guild):
+    roleNames.pop(guild.id, None)
+
+
+def add(role):
+    if role.guild.id in roleNames:
+        roleNames[role.guild.id].setdefault(role.name, role.id)
+
+
+def remove(role):
+    names = roleNames.get(role.guild.id)
+    if names is None or names.get(role.name) != role.id:
+        return
+    names.pop(role.name)
+    # another role may share the name. only happens on delete/rename of a duplicate so the scan is rare
+    duplicate = discord.utils.get(role.guild.roles, name=role.name)
+    if duplicate and duplicate.id != role.id:
+        names[role.name] = duplicate.id
+
+
+def get_role_by_name(guild, roleName):
+    '''
+    Return the discord role object for a name, or None if no role has that name.
+    '''
+    names = roleNames.get(guild.id)
+    if names is None:
+        names = build(guild)
+    roleID = names.get(roleName)
+    if roleID is None:
+        return None
+    return guild.get_role(roleID)
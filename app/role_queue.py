@@ -0,0 +1,147 @@
+import asyncio
+import os
+import discord
+
+# py files
+import logger # used to write logs to google log explorer as well as to stdout
+import rest_scheduler # rate limit aware queue for discord REST calls
+import member_cache # member lookups without a REST call per event
+
+'''
+Coalesces role changes per member so a burst of reactions becomes one member.edit call.
+Reaction listeners queue an add/remove intent. The first intent for a member opens a window,
+every intent that arrives inside it is netted out, and one edit is sent when the window closes.
+Adding then removing the same role inside a window cancels out and costs no API call.
+
+Only one flush per member runs at a time. Intents that arrive while a member's edit is queued or in flight are kept
+and sent after it, so two edits for the same member never race and overwrite each other.
+The role list is built when the request is sent, from the member returned by the previous edit or the gateway cache,
+never from a copy taken when the change was queued. Members the gateway cache doesn't hold are changed role by role
+with add_roles/remove_roles instead, so a stale fetched copy can't undo changes made by admins or other bots.
+'''
+
+# seconds to collect role changes for a member before sending them to discord
+window = float(os.getenv('role_batch_window', '0.5'))
+
+pending = {} # format: {(guildID, memberID): {roleID: True for add / False for remove}}
+flushes = {} # format: {(guildID, memberID): task sending that member's changes, new intents join pending while it runs}
+editRoute = 'Member.edit' # rest scheduler bucket role edits are paced by
+
+
+def queue_role_change(guild, memberID, roleID, add):
+    '''
+    guild: discord guild object
+    memberID: id of the member to change
+    roleID: id of the role to add or remove
+    add: True to add the role, False to remove it
+    '''
+    key = (guild.id, memberID)
+    changes = pending.setdefault(key, {})
+    if roleID in changes and changes[roleID] != add:
+        del changes[roleID] # opposite intents inside one window cancel out
+    else:
+        changes[roleID] = add
+
+    if key not in flushes:
+        flushes[key] = asyncio.ensure_future(flush_later(guild, memberID))
+
+
+async def apply_now(guild, memberID, changes, priority=rest_scheduler.NORMAL, reason='Role selection reactions'):
+    '''
+    Send changes for a member without waiting for a window, in line with any live changes for them.
+    Returns False without sending anything if the member already has changes queued or in flight,
+    those come from live reactions and are newer.
+    '''
+    key = (guild.id, memberID)
+    if key in flushes:
+        return False
+    pending[key] = dict(changes)
+    flushes[key] = asyncio.ensure_future(flush_later(guild, memberID, 0, priority, reason))
+    await flushes[key]
+    return True
+
+
+async def flush_later(guild, memberID, delay=None, priority=rest_scheduler.NORMAL, reason='Role selection reactions'):
+    key = (guild.id, memberID)
+    try:
+        await asyncio.sleep(window if delay is None else delay)
+        latest = None # the member as returned by this flush's last edit
+        # intents that arrived while an edit was in flight are sent right after it
+        while pending.get(key):
+            latest = await apply_role_changes(guild, memberID, pending.pop(key), latest, priority, reason)
+    finally:
+        # no await between the loop ending and this, so a new intent either made it into the loop or starts a new flush
+        pending.pop(key, None)
+        flushes.pop(key, None)
+
+
+async def apply_role_changes(guild, memberID, changes, latest=None, priority=rest_scheduler.NORMAL, reason='Role selection reactions'):
+    '''
+    Send one member's role changes. Returns the member as discord returned it after an edit, or None if unknown.
+    latest: the member returned by the previous edit in this flush, fresher than the gateway cache
+    '''
+    if not changes:
+        return latest
+
+    try:
+        if latest is None and guild.get_member(memberID) is None:
+            # only a fetched copy is available, it can be up to member_cache_ttl old
+            member = await member_cache.resolve_member(guild, memberID)
+            await apply_role_diff(guild, member, changes, priority, reason)
+            return None
+
+        def new_roles(member):
+            # roles[0] is @everyone, it can't be sent in an edit
+            roles = {role.id: role for role in member.roles[1:]}
+            for roleID, add in changes.items():
+                if add:
+                    role = guild.get_role(roleID)
+                    if role is not None:
+                        roles[roleID] = role
+                else:
+                    roles.pop(roleID, None)
+            return None if set(roles) == {role.id for role in member.roles[1:]} else list(roles.values())
+
+        if new_roles(latest or guild.get_member(memberID)) is None:
+            return latest # the burst netted out to what the member already has, no request needed
+
+        async def edit_roles():
+            # read the member's roles again when the request is sent, not when the change was queued
+            member = latest or guild.get_member(memberID)
+            roles = new_roles(member)
+            return member if roles is None else await member.edit(roles=roles, reason=reason)
+
+        edited = await rest_scheduler.submit(guild.id, edit_roles, priority=priority, route=editRoute)
+        member_cache.forget_member(guild.id, memberID)
+        logger.write_log(
+            action='role_queue',
+            payload=f'Applied {len(changes)} role change(s) to {edited or memberID} in one edit.',
+            severity='Debug'
+        )
+        return edited
+    except Exception as e:
+        logger.write_log(
+            action='role_queue',
+            payload=e,
+            severity='Error'
+        )
+        return None
+
+
+async def apply_role_diff(guild, member, changes, priority, reason):
+    '''
+    One add or remove call per role. Slower than one edit, but it only touches the roles that changed
+    '''
+    for roleID, add in changes.items():
+        if add:
+            role = guild.get_role(roleID)
+            if role is None:
+                continue # deleted since the intent was queued
+            await rest_scheduler.submit(guild.id, member.add_roles, role, reason=reason, priority=priority)
+        else:
+            await rest_scheduler.submit(guild.id, member.remove_roles, guild.get_role(roleID) or discord.Object(id=roleID), reason=reason, priority=priority)
+    logger.write_log(
+        action='role_queue',
+        payload=f'Applied {len(changes)} role change(s) to {member} one role at a time.',
+        severity='Debug'
+    )
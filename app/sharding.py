@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import fcntl
+import os
+import time
+
+'''
+Shard assignment and per-shard health.
+discord routes every guild to shard (guild_id >> 22) % shard_count. A worker started by launcher.py is given
+shard_ids and shard_count and only receives events for guilds on those shards, so it only loads and caches those guilds.
+Event rates are sampled from each shard's gateway sequence number, which goes up by one for every event the shard receives.
+
+Workers started by launcher.py share identify_dir. Before a shard identifies it takes its bucket's lock file there
+and waits until identifyInterval has passed since the last identify in that bucket, from any worker.
+That keeps every worker on the host inside discord's identify limit no matter when each one was started.
+'''
+
+sampleInterval = float(os.getenv('shard_stats_interval', '10')) # seconds between event rate samples
+identifyDir = os.getenv('identify_dir') # set by launcher.py, None when every shard runs in this process
+identifyConcurrency = int(os.getenv('identify_concurrency', '1')) # discord's max_concurrency for the bot
+identifyInterval = 5.5 # seconds discord needs between identify calls in the same concurrency bucket
+
+sequences = {} # format: {shardID: (sampled at, sequence)}
+eventRates = {} # format: {shardID: events per second over the last interval}
+eventTotals = collections.Counter() # events per shard since the process started
+connects = collections.Counter()
+disconnects = collections.Counter()
+resumes = collections.Counter()
+
+
+def parse_shard_ids(value):
+    '''
+    "0,1,2" or "0-2" -> [0, 1, 2]. None or "" -> None (every shard)
+    '''
+    if not value:
+        return None
+    shardIDs = []
+    for part in value.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            shardIDs.extend(range(int(first), int(last) + 1))
+        else:
+            shardIDs.append(int(part))
+    return shardIDs
+
+
+def guild_shard(guildID, shardCount):
+    return (int(guildID) >> 22) % shardCount
+
+
+def owns_guild(bot, guildID):
+    '''
+    True if guildID is on one of this process's shards. Always True when every shard runs here.
+    '''
+    if bot.shard_ids is None or not bot.shard_count:
+        return True
+    return guild_shard(guildID, bot.shard_count) in bot.shard_ids
+
+
+def shard_sequence(shard):
+    # ShardInfo doesn't expose the gateway sequence, read it from the shard's websocket
+    ws = getattr(getattr(shard, '_parent', None), 'ws', None)
+    return getattr(ws, 'sequence', None)
+
+
+def sample(bot):
+    '''
+    Update event rates for every shard. Called every sampleInterval seconds.
+    '''
+    now = time.monotonic()
+    for shardID, shard in bot.shards.items():
+        sequence = shard_sequence(shard)
+        if sequence is None:
+            continue
+        previous = sequences.get(shardID)
+        sequences[shardID] = (now, sequence)
+        if previous is None:
+            continue
+        # a new session starts counting from 1 again
+        events = sequence - previous[1] if sequence >= previous[1] else sequence
+        eventTotals[shardID] += events
+        eventRates[shardID] = events / (now - previous[0])
+
+
+def stats(bot):
+    '''
+    Return {shardID: {latency, eventRate, events, connects, disconnects, resumes, closed}}
+    '''
+    return {
+        shardID: {
+            'latency': shard.latency,
+            'eventRate': eventRates.get(shardID, 0.0),
+            'events': eventTotals[shardID],
+            'connects': connects[shardID],
+            'disconnects': disconnects[shardID],
+            'resumes': resumes[shardID],
+            'closed': shard.is_closed()
+        }
+        for shardID, shard in sorted(bot.shards.items())
+    }
+
+
+def claim_identify(shardID):
+    '''
+    Blocking. Wait for this shard's identify bucket to be free across every worker, then mark it used.
+    '''
+    # discord puts shard_id % max_concurrency in one bucket, each bucket allows one identify per interval
+    path = os.path.join(identifyDir, f'identify-{shardID % identifyConcurrency}')
+    with open(path, 'a+') as bucket:
+        fcntl.flock(bucket, fcntl.LOCK_EX) # released when the file is closed
+        bucket.seek(0)
+        last = float(bucket.read() or 0)
+        wait = last + identifyInterval - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        bucket.seek(0)
+        bucket.truncate()
+        bucket.write(str(time.time()))
+
+
+async def wait_identify(shardID):
+    # the lock file is shared with other processes, wait for it off the event loop
+    await asyncio.get_event_loop().run_in_executor(None, claim_identify, shardID)
@@ -0,0 +1,98 @@
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Startup timing and backend initialization.
+main.py imports this first so started is as close to process start as possible.
+The google backends (secret manager, firestore, cloud logging, translate) don't depend on each other, so they are
+initialized on their own threads at the same time instead of one after another at import.
+Each step is timed and the breakdown is logged once the bot is ready.
+'''
+
+started = time.perf_counter()
+phases = {} # format: {phase: seconds}, in the order they finished
+backends = {} # format: {backend name: future for its initializer}
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='startup')
+readyAt = None
+lastEnd = started # when the last timed phase finished, the gateway connect is measured from here
+
+
+@contextlib.contextmanager
+def phase(name):
+    '''
+    with startup.phase('cogs'):
+    Records how long the block took
+    '''
+    global lastEnd
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        lastEnd = time.perf_counter()
+        phases[name] = lastEnd - start
+
+
+def mark(name):
+    # record a phase that ran from process start until now, like imports
+    global lastEnd
+    lastEnd = time.perf_counter()
+    phases[name] = lastEnd - started
+
+
+def run_backend(name, initializer):
+    start = time.perf_counter()
+    try:
+        return initializer()
+    finally:
+        phases[f'backend:{name}'] = time.perf_counter() - start
+
+
+def start_backends(initializers):
+    '''
+    initializers: {name: function}. Each one starts on a startup thread right away.
+    '''
+    for name, initializer in initializers.items():
+        backends[name] = executor.submit(run_backend, name, initializer)
+
+
+def wait_backend(name):
+    '''
+    Block until a backend is initialized and return its initializer's result. Raises if it failed.
+    For use before the event loop starts.
+    '''
+    start = time.perf_counter()
+    try:
+        return backends[name].result()
+    finally:
+        phases[f'wait:{name}'] = time.perf_counter() - start
+
+
+async def backend_ready(name):
+    '''
+    Wait for a backend without blocking the event loop. Raises if it failed.
+    '''
+    start = time.perf_counter()
+    try:
+        return await asyncio.wrap_future(backends[name])
+    finally:
+        phases[f'wait:{name}'] = time.perf_counter() - start
+
+
+def ready():
+    '''
+    Called when the bot is first ready. Returns the startup breakdown, or None after the first call.
+    '''
+    global readyAt
+    if readyAt is not None:
+        return None
+    now = time.perf_counter()
+    phases['connect'] = now - lastEnd # gateway connect and member chunking
+    readyAt = now - started
+    breakdown = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in phases.items())
+    # backends nobody waited on yet (logging, translate) retry on first use if they failed here
+    failed = [f'{name} ({future.exception()})' for name, future in backends.items() if future.done() and future.exception()]
+    if failed:
+        breakdown += f". Failed to initialize {', '.join(failed)}"
+    return f'Ready {readyAt:.2f}s after start. {breakdown}'
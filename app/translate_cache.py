@@ -0,0 +1,111 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+'''
+Memoizes translation results so repeated phrases don't go back to the translate API.
+Entries are keyed by normalized text + target language and live in a size bounded LRU with a TTL.
+Set translate_cache_path to also keep results in a local sqlite file that survives restarts.
+get() only looks in memory and is safe to call on the event loop. The sqlite file is read by load() and written by put(),
+both blocking, so they are only called from the translate thread pool.
+'''
+
+maxSize = int(os.getenv('translate_cache_size', '5000'))
+ttl = float(os.getenv('translate_cache_ttl', '86400')) # seconds
+cachePath = os.getenv('translate_cache_path') # optional sqlite file
+
+memory = collections.OrderedDict() # format: {(text, target): (stored at, result)}
+lock = threading.Lock() # guards memory and the stats, never held across disk I/O
+dbLock = threading.Lock() # the sqlite connection is shared by the translate threads
+db = None
+
+# stats
+hits = 0
+diskHits = 0
+misses = 0
+
+if cachePath:
+    db = sqlite3.connect(cachePath, check_same_thread=False)
+    db.execute('CREATE TABLE IF NOT EXISTS translations (text TEXT, target TEXT, result TEXT, stored REAL, PRIMARY KEY (text, target))')
+    db.commit()
+
+
+def normalize(text):
+    # same phrase with different spacing or unicode composition is the same request
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def get(text, target):
+    '''
+    Return the result for text/target from memory or None. Never touches the disk.
+    With a sqlite file, a None here is followed by load() on the translate thread pool.
+    '''
+    global hits, misses
+    key = (normalize(text), target)
+    now = time.time()
+    with lock:
+        cached = memory.get(key)
+        if cached and now - cached[0] < ttl:
+            memory.move_to_end(key)
+            hits += 1
+            return cached[1]
+        if db is None:
+            misses += 1
+        return None
+
+
+def load(text, target):
+    '''
+    Blocking. Return the result for text/target from the sqlite file or None, and keep it in memory for next time.
+    '''
+    global diskHits, misses
+    if db is None:
+        return None
+    key = (normalize(text), target)
+    now = time.time()
+    with dbLock:
+        row = db.execute('SELECT result, stored FROM translations WHERE text = ? AND target = ?', key).fetchone()
+    result = json.loads(row[0]) if row and now - row[1] < ttl else None
+    with lock:
+        if result is None:
+            misses += 1
+        else:
+            store_memory(key, row[1], result)
+            diskHits += 1
+    return result
+
+
+def put(text, target, result):
+    '''
+    Blocking when there is a sqlite file
+    '''
+    key = (normalize(text), target)
+    now = time.time()
+    with lock:
+        store_memory(key, now, result)
+    if db is not None:
+        with dbLock:
+            db.execute('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)', (key[0], key[1], json.dumps(result), now))
+            db.commit()
+
+
+def store_memory(key, stored, result):
+    memory[key] = (stored, result)
+    memory.move_to_end(key)
+    while len(memory) > maxSize:
+        memory.popitem(last=False)
+
+
+def stats():
+    lookups = hits + diskHits + misses
+    return {
+        'hits': hits,
+        'diskHits': diskHits,
+        'misses': misses,
+        'hitRatio': (hits + diskHits) / lookups if lookups else 0.0,
+        'size': len(memory)
+    }